@@ -0,0 +1,190 @@
+"""
+Benchmark: full-size image allocations per steady-state cycle
+
+Simulates cycles of the compositing work that runs on every new radar frame:
+overlay copyright/timestamp stripping, compositing onto the base image, the
+house-marked GIF frames for the whole loop and eviction of the oldest
+composite. It runs twice, each time in its own process:
+
+- legacy: the copy-per-step implementation (image.copy() in every strip
+  function, base_image.copy() per composite, frame.copy() per GIF frame)
+- pooled: the current implementation (in-place strip processing, canvases
+  recycled through CanvasPool)
+
+and reports the image memory allocated per cycle (all images, and the number
+of full-size ones), time per cycle and peak RSS. The synthetic input frames
+(two per cycle) are included in both variants.
+
+Usage (from the repository root):
+    python benchmarks/canvas_reuse.py [--cycles 50]
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+from PIL import Image
+
+import bom_radar_downloader
+
+LOOP_FRAMES = 5
+WARMUP_CYCLES = LOOP_FRAMES + 1
+FULL_SIZE = 512 * 512
+
+allocations = {'bytes': 0, 'full_size': 0}
+
+
+def count_allocations():
+    """Record the size of every image Pillow creates"""
+    new = Image.Image._new
+
+    def counting_new(self, im):
+        image = new(self, im)
+        pixels = image.size[0] * image.size[1]
+        allocations['bytes'] += pixels * Image.getmodebands(image.mode)
+        allocations['full_size'] += pixels >= FULL_SIZE
+        return image
+
+    Image.Image._new = counting_new
+
+
+class CopyingPool:
+    """Stand-in for CanvasPool reproducing the old allocate-every-time behaviour"""
+
+    def copy(self, image):
+        return image.copy()
+
+    def release(self, *images):
+        pass
+
+
+def legacy_remove_copyright(image):
+    img = image.copy()
+    width, height = img.size
+    pixels = img.load()
+    for y in range(min(16, height)):
+        for x in range(width):
+            pixels[x, y] = (0, 0, 0, 0)
+    return img
+
+
+def legacy_make_timestamp_transparent(image):
+    img = image.copy()
+    width, height = img.size
+    pixels = img.load()
+    for y in range(max(0, height - 20), height):
+        for x in range(width):
+            r, g, b, a = pixels[x, y]
+            if r <= 2 and g <= 2 and b <= 2:
+                pixels[x, y] = (0, 0, 0, 0)
+    return img
+
+
+def radar_frame(seed):
+    """Synthetic transparent radar frame with some rain and timestamp text"""
+    rng = random.Random(seed)
+    image = Image.new('RGBA', (512, 512), (0, 0, 0, 0))
+    for _ in range(40):
+        x, y = rng.randrange(480), rng.randrange(16, 470)
+        image.paste((20, 20, 255, 255), (x, y, x + rng.randrange(8, 32), y + rng.randrange(8, 32)))
+    image.paste((0, 0, 0, 255), (10, 496, 200, 508))
+    image.paste((255, 255, 255, 255), (0, 0, 512, 16))
+    return image
+
+
+def make_processor():
+    os.chdir(REPO)
+    config = bom_radar_downloader.Config.load()
+    config.update({
+        'output_directory': tempfile.mkdtemp(prefix='canvas_reuse_'),
+        'legend_file': os.path.join(REPO, 'IDR.legend.0.png'),
+        'residential_enabled': True,
+        'residential_lat': -37.85,
+        'residential_lon': 145.0,
+        'rain_sensor_enabled': False,
+        'grid_export_enabled': False,
+        'state_enabled': False,
+        'archive_enabled': False,
+        'profile_enabled': False,
+        'trace_enabled': False,
+        'ftp_session_mode': 'live',
+    })
+    return bom_radar_downloader.RadarProcessor(config)
+
+
+def run(variant, cycles):
+    processor = make_processor()
+    if variant == 'legacy':
+        processor.canvas_pool = CopyingPool()
+        processor.remove_copyright = legacy_remove_copyright
+        processor.make_timestamp_transparent = legacy_make_timestamp_transparent
+
+    base_image = processor.load_legend()
+    legend_area = base_image.crop((0, base_image.size[1] - 45, base_image.size[0], base_image.size[1]))
+    house_icon = processor.load_house_icon()
+    composites = []
+
+    def cycle(number):
+        primary = radar_frame(number)
+        overlay = processor.make_timestamp_transparent(processor.remove_copyright(radar_frame(-number)))
+        composites.append(processor.composite_frame(base_image, legend_area, primary, [('Second', overlay)]))
+        if len(composites) > LOOP_FRAMES:
+            processor.canvas_pool.release(composites.pop(0))
+
+        processor.add_house_markers(composites, house_icon)
+        # The encoder would run here; afterwards the GIF frames are recycled
+        processor.canvas_pool.release(*processor.release_after_encode)
+        processor.release_after_encode = []
+
+    for number in range(WARMUP_CYCLES):
+        cycle(number)
+
+    count_allocations()
+    start = time.perf_counter()
+    for number in range(WARMUP_CYCLES, WARMUP_CYCLES + cycles):
+        cycle(number)
+    elapsed = time.perf_counter() - start
+
+    return {
+        'variant': variant,
+        'mb_per_cycle': allocations['bytes'] / cycles / (1024 * 1024),
+        'full_size_per_cycle': allocations['full_size'] / cycles,
+        'ms_per_cycle': elapsed * 1000 / cycles,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cycles', type=int, default=50)
+    parser.add_argument('--variant', choices=['legacy', 'pooled'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.variant:
+        print(json.dumps(run(args.variant, args.cycles)))
+        return
+
+    results = []
+    for variant in ('legacy', 'pooled'):
+        output = subprocess.run(
+            [sys.executable, __file__, '--variant', variant, '--cycles', str(args.cycles)],
+            check=True, capture_output=True, text=True
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    print(f"{'variant':<8} {'MB/cycle':>9} {'full-size/cycle':>16} {'ms/cycle':>9} {'peak RSS MB':>12}")
+    for result in results:
+        print(f"{result['variant']:<8} {result['mb_per_cycle']:>9.1f} {result['full_size_per_cycle']:>16.1f} "
+              f"{result['ms_per_cycle']:>9.1f} {result['peak_rss_mb']:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
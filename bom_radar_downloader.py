@@ -1,21 +1,45 @@
 #!/usr/bin/env python3
+import errno
 import io
 import ftplib
+import hashlib
+import itertools
 import smbclient
 import os
 import sys
 import asyncio
 import logging
-from PIL import Image
-from datetime import datetime
+from PIL import Image, ImageChops
+from datetime import datetime, timedelta
 from pathlib import Path
 import pytz
 import yaml
 import math
 from radar_metadata import RADAR_METADATA
+from ftp_transport import FTPTransport
+from ftp_replay import session_from_config
+from frame_discovery import FrameDiscovery
+from radar_archive import RadarArchive
+from image_encoder import ImageEncoder
+from renditions import FORMATS, load_renditions
+from pipeline import Pipeline
+from circuit_breaker import Backoff, CircuitBreaker
+from rain_sensor import RainSensor
+from precip_grid import PrecipitationGrid
+from cycle_profiler import CycleProfiler
+from cycle_trace import CycleTracer
+from reprojection import Reprojector
+from canvas_pool import CanvasPool
+from live_stream import LiveStream
+from frame_tweening import FrameTweener
+from sprite_bundle import SpriteBundle
+from state_snapshot import load_snapshot, pack_image, save_snapshot, unpack_image
 
 VERSION = '1.0.0'
 
+# Point table masking channel values of 2 or less (near-black timestamp text)
+DARK_LUT = [255] * 3 + [0] * 253
+
 # Check multiple possible config file locations
 CONFIG_PATHS = [
     Path('/app/config.yaml'),
@@ -29,6 +53,13 @@ for path in CONFIG_PATHS:
         CONFIG_FILE = path
         break
 
+# Settings read once at startup; changing them in a running process needs a restart
+RESTART_KEYS = (
+    'scheduler_enabled', 'log_level', 'output_directory', 'encode_workers',
+    'png_', 'optimize_size', 'archive_', 'state_', 'profile_', 'trace_', 'breaker_',
+    'ftp_session_', 'ftp_replay_', 'ftp_discovery', 'ftp_resync_cycles',
+)
+
 
 class Config:
     """Configuration management"""
@@ -45,6 +76,8 @@ class Config:
         
         with open(CONFIG_FILE, 'r') as file:
             config = yaml.safe_load(file)
+        if not isinstance(config, dict):
+            raise ValueError(f'{CONFIG_FILE} does not contain any settings')
         
         # Allow environment variable overrides
         radar = config.get('radar', {})
@@ -56,6 +89,16 @@ class Config:
         residential = config.get('residential_location', {})
         second_radar = config.get('second_radar', {})
         third_radar = config.get('third_radar', {})
+        ftp = config.get('ftp', {})
+        archive = config.get('archive', {})
+        state = config.get('state', {})
+        rain_sensor = config.get('rain_sensor', {})
+        grid_export = config.get('grid_export', {})
+        profiling = config.get('profiling', {})
+        trace = config.get('trace', {})
+        breaker = config.get('circuit_breaker', {})
+        stream = config.get('stream', {})
+        bundle = config.get('bundle', {})
         
         return {
             # Radar settings
@@ -67,6 +110,28 @@ class Config:
             'update_interval': int(os.getenv('UPDATE_INTERVAL', scheduler.get('update_interval', 600))),
             'retry_on_error': scheduler.get('retry_on_error', True),
             'retry_interval': int(os.getenv('RETRY_INTERVAL', scheduler.get('retry_interval', 60))),
+            'retry_interval_max': int(os.getenv('RETRY_INTERVAL_MAX', scheduler.get('retry_interval_max', 1800))),
+            'retry_jitter': float(os.getenv('RETRY_JITTER', scheduler.get('retry_jitter', 0.2))),
+            'config_reload': os.getenv('CONFIG_RELOAD', str(scheduler.get('config_reload', True))).lower() == 'true',
+            
+            # Circuit breakers for the BOM FTP source and the SMB sink
+            'breaker_failure_threshold': int(os.getenv('BREAKER_FAILURE_THRESHOLD', breaker.get('failure_threshold', 3))),
+            'breaker_reset_timeout': int(os.getenv('BREAKER_RESET_TIMEOUT', breaker.get('reset_timeout', 60))),
+            'breaker_reset_timeout_max': int(os.getenv('BREAKER_RESET_TIMEOUT_MAX', breaker.get('reset_timeout_max', 1800))),
+            
+            # FTP transfer settings
+            'ftp_timeout': int(os.getenv('FTP_TIMEOUT', ftp.get('timeout', 30))),
+            'ftp_max_retries': int(os.getenv('FTP_MAX_RETRIES', ftp.get('max_retries', 3))),
+            'ftp_retry_backoff': float(os.getenv('FTP_RETRY_BACKOFF', ftp.get('retry_backoff', 2.0))),
+            'ftp_retry_backoff_max': float(os.getenv('FTP_RETRY_BACKOFF_MAX', ftp.get('retry_backoff_max', 30.0))),
+            'ftp_persistent': os.getenv('FTP_PERSISTENT', str(ftp.get('persistent', False))).lower() == 'true',
+            'ftp_keepalive_interval': int(os.getenv('FTP_KEEPALIVE_INTERVAL', ftp.get('keepalive_interval', 60))),
+            'ftp_discovery': os.getenv('FTP_DISCOVERY', ftp.get('discovery', 'listing')).lower(),
+            'ftp_resync_cycles': int(os.getenv('FTP_RESYNC_CYCLES', ftp.get('resync_cycles', 12))),
+            'ftp_session_mode': os.getenv('FTP_SESSION_MODE', ftp.get('session_mode', 'live')).lower(),
+            'ftp_session_directory': os.getenv('FTP_SESSION_DIR', ftp.get('session_directory', '/images/ftp_sessions')),
+            'ftp_replay_latency_ms': float(os.getenv('FTP_REPLAY_LATENCY_MS', ftp.get('replay_latency_ms', 0))),
+            'ftp_replay_bandwidth_kbps': int(os.getenv('FTP_REPLAY_BANDWIDTH_KBPS', ftp.get('replay_bandwidth_kbps', 0))),
             
             # SMB settings
             'smb_server': os.getenv('SMB_SERVER', smb.get('server')),
@@ -83,11 +148,71 @@ class Config:
             'animated_gif_filename': os.getenv('ANIMATED_GIF', output.get('animated_gif', 'radar_animated.gif')),
             'timestamp_filename': os.getenv('TIMESTAMP_FILE', output.get('timestamp_file', 'radar_last_update.txt')),
             'legend_file': os.getenv('LEGEND_FILE', output.get('legend_file', '/app/IDR.legend.0.png')),
+            'encode_workers': int(os.getenv('ENCODE_WORKERS', output.get('encode_workers', 1))),
+            'pipeline_queue_size': int(os.getenv('PIPELINE_QUEUE_SIZE', output.get('pipeline_queue_size', 2))),
+            'png_compression': int(os.getenv('PNG_COMPRESSION', output.get('png_compression', 6))),
+            'png_strategy': os.getenv('PNG_STRATEGY', output.get('png_strategy', 'default')).lower(),
+            'optimize_size': os.getenv('OPTIMIZE_SIZE', str(output.get('optimize_size', False))).lower() == 'true',
+            
+            # Rolling HLS stream of the loop
+            'stream_enabled': os.getenv('STREAM_ENABLED', str(stream.get('enabled', False))).lower() == 'true',
+            'stream_playlist': os.getenv('STREAM_PLAYLIST', stream.get('playlist', 'radar_stream.m3u8')),
+            'stream_segment_seconds': float(os.getenv('STREAM_SEGMENT_SECONDS', stream.get('segment_seconds', 1.0))),
+            'stream_window': int(os.getenv('STREAM_WINDOW', stream.get('window', 10))),
+            'stream_crf': int(os.getenv('STREAM_CRF', stream.get('crf', 28))),
+            'stream_ffmpeg': os.getenv('STREAM_FFMPEG', stream.get('ffmpeg', 'ffmpeg')),
+            
+            # Single-file sprite sheet bundle of the loop
+            'bundle_enabled': os.getenv('BUNDLE_ENABLED', str(bundle.get('enabled', False))).lower() == 'true',
+            'bundle_basename': os.getenv('BUNDLE_BASENAME', bundle.get('basename', 'radar_bundle')),
+            'bundle_manifest_file': os.getenv('BUNDLE_MANIFEST_FILE', str(bundle.get('manifest_file', False))).lower() == 'true',
+            'bundle_upload_only': os.getenv('BUNDLE_UPLOAD_ONLY', str(bundle.get('upload_only', False))).lower() == 'true',
+            
+            # Extra crop/resize/format variants of the loop
+            'renditions': config.get('renditions') or [],
+            
+            # Archive settings
+            'archive_enabled': os.getenv('ARCHIVE_ENABLED', str(archive.get('enabled', False))).lower() == 'true',
+            'archive_directory': os.getenv('ARCHIVE_DIR', archive.get('directory', '/images/archive')),
+            'archive_retention_hours': int(os.getenv('ARCHIVE_RETENTION_HOURS', archive.get('retention_hours', 24))),
+            'archive_max_frames': int(os.getenv('ARCHIVE_MAX_FRAMES', archive.get('max_frames', 1000))),
+            'archive_long_loop_hours': float(os.getenv('ARCHIVE_LONG_LOOP_HOURS', archive.get('long_loop_hours', 0))),
+            'archive_long_loop_gif': os.getenv('ARCHIVE_LONG_LOOP_GIF', archive.get('long_loop_gif', 'radar_long_loop.gif')),
+            
+            # Rain-at-location sensor
+            'rain_sensor_enabled': os.getenv('RAIN_SENSOR_ENABLED', str(rain_sensor.get('enabled', False))).lower() == 'true',
+            'rain_sensor_radius_km': float(os.getenv('RAIN_SENSOR_RADIUS_KM', rain_sensor.get('radius_km', 5))),
+            'rain_sensor_ring_km': float(os.getenv('RAIN_SENSOR_RING_KM', rain_sensor.get('ring_km', 25))),
+            'rain_sensor_filename': os.getenv('RAIN_SENSOR_FILE', rain_sensor.get('filename', 'radar_rain.json')),
+            
+            # Decoded precipitation grid export
+            'grid_export_enabled': os.getenv('GRID_EXPORT_ENABLED', str(grid_export.get('enabled', False))).lower() == 'true',
+            'grid_export_basename': os.getenv('GRID_EXPORT_BASENAME', grid_export.get('basename', 'radar_grid')),
+            'grid_export_upload': os.getenv('GRID_EXPORT_UPLOAD', str(grid_export.get('upload', False))).lower() == 'true',
+            
+            # Warm-restart state snapshot
+            'state_enabled': os.getenv('STATE_ENABLED', str(state.get('enabled', False))).lower() == 'true',
+            'state_file': os.getenv('STATE_FILE', state.get('snapshot_file', '/images/radar_state.pkl')),
+            
+            # Per-cycle profiling
+            'profile_enabled': os.getenv('PROFILE_ENABLED', str(profiling.get('enabled', False))).lower() == 'true',
+            'profile_cprofile': os.getenv('PROFILE_CPROFILE', str(profiling.get('cprofile', True))).lower() == 'true',
+            'profile_tracemalloc': os.getenv('PROFILE_TRACEMALLOC', str(profiling.get('tracemalloc', False))).lower() == 'true',
+            'profile_every': int(os.getenv('PROFILE_EVERY', profiling.get('every', 1))),
+            'profile_keep': int(os.getenv('PROFILE_KEEP', profiling.get('keep', 5))),
+            'profile_top': int(os.getenv('PROFILE_TOP', profiling.get('top', 25))),
+            'profile_directory': os.getenv('PROFILE_DIR', profiling.get('directory', '')),
+            
+            # Structured per-cycle trace
+            'trace_enabled': os.getenv('TRACE_ENABLED', str(trace.get('enabled', False))).lower() == 'true',
+            'trace_output': os.getenv('TRACE_OUTPUT', trace.get('output', 'radar_trace.jsonl')),
+            'trace_max_bytes': int(os.getenv('TRACE_MAX_BYTES', trace.get('max_bytes', 10 * 1024 * 1024))),
             
             # GIF settings
             'gif_duration': int(os.getenv('GIF_DURATION', gif.get('duration', 500))),
             'gif_last_frame_duration': int(os.getenv('GIF_LAST_FRAME_DURATION', gif.get('last_frame_duration', 1000))),
             'gif_loop': int(os.getenv('GIF_LOOP', gif.get('loop', 0))),
+            'gif_tween_frames': int(os.getenv('GIF_TWEEN_FRAMES', gif.get('tween_frames', 0))),
             
             # Logging
             'log_level': os.getenv('LOG_LEVEL', log_config.get('level', 'INFO')).upper(),
@@ -106,6 +231,37 @@ class Config:
             'third_radar_product_id': third_radar.get('product_id'),
         }
 
+    @staticmethod
+    def fingerprint(config):
+        """Digest of every setting, to tell whether outputs were made with the same configuration"""
+        return hashlib.sha256(repr(sorted(config.items(), key=lambda item: item[0])).encode()).hexdigest()
+
+    @staticmethod
+    def modified():
+        """Modification time of the configuration file, or None if it cannot be read"""
+        try:
+            return CONFIG_FILE.stat().st_mtime_ns
+        except (AttributeError, OSError):
+            return None
+
+    @staticmethod
+    def reload():
+        """Load the configuration again after the file changed
+
+        Returns:
+            dict: The new configuration, or None if the file is missing or
+            invalid (e.g. caught half-written), in which case the running
+            configuration should be kept
+        """
+        if not CONFIG_FILE or not CONFIG_FILE.exists():
+            logging.error(f'Configuration file {CONFIG_FILE} has gone - keeping the current configuration')
+            return None
+        try:
+            return Config.load()
+        except Exception as e:
+            logging.error(f'Could not reload configuration - keeping the current configuration: {e}')
+            return None
+
 
 class RadarProcessor:
     """Processes radar images from BOM FTP"""
@@ -113,11 +269,274 @@ class RadarProcessor:
     def __init__(self, config):
         self.config = config
         self.frames = []
+        self.frame_keys = []  # composite key (primary file, overlay files...) of each frame
         self.saved_filenames = []
+        self.ftp = None
+        self.discovery = FrameDiscovery.from_config(config)
+
+        # Recording or replay of FTP sessions instead of plain live sessions (optional)
+        self.ftp_session = session_from_config(config)
+
+        self.metrics = {'cycles': 0, 'cycles_skipped': 0}
+
+        # Stop contacting BOM or the SMB share while they are down
+        self.ftp_breaker = CircuitBreaker.from_config('BOM FTP', config)
+        self.smb_breaker = CircuitBreaker.from_config('SMB share', config)
+        self.tracer = CycleTracer.from_config(config)
+        self.reset_state()
         
         # Create output directory if it doesn't exist
         os.makedirs(self.config['output_directory'], exist_ok=True)
+
+        # Local archive of raw frames (optional)
+        self.archive = RadarArchive.from_config(config)
+
+        # Extra output variants, encoded in a process pool
+        self.renditions = load_renditions(config['renditions'])
+        self.encoder = ImageEncoder.from_config(config, tracer=self.tracer)
+        self.reprojector = Reprojector()
+
+        # Full-size frames are recycled rather than allocated every cycle
+        self.canvas_pool = CanvasPool()
+        self.release_after_encode = []  # pooled canvases in use until the encoder is done
+
+        # Rain intensity around the residential location (optional)
+        self.rain_sensor = self.create_rain_sensor()
+
+        # Intensity level arrays for downstream consumers (optional)
+        self.precip_grid = None
+        if self.config['grid_export_enabled']:
+            self.precip_grid = PrecipitationGrid(self.config['grid_export_basename'])
+
+        # Rolling HLS stream, one segment per new frame (optional)
+        self.stream = LiveStream.from_config(config)
+
+        # The whole loop as one sprite sheet file, optionally uploaded instead of the images and GIF
+        self.bundle = SpriteBundle.from_config(config)
+        self.bundle_only = self.bundle is not None and config['bundle_upload_only']
+
+        # Crossfades between radar frames in the animated GIF (optional)
+        self.tweener = FrameTweener.from_config(config)
+
+        # cProfile/tracemalloc around selected cycles (optional)
+        self.profiler = CycleProfiler.from_config(config)
+
+        # Pick up where the previous run left off
+        if self.config['state_enabled']:
+            self.restore_state()
     
+    def save_state(self):
+        """Atomically write a snapshot of the working state for warm restarts"""
+        state = {
+            'config_fingerprint': Config.fingerprint(self.config),
+            'last_frame_set': self.last_frame_set,
+            'discovery_known': self.discovery.known,
+            'discovery_cycles_since_sync': self.discovery.cycles_since_sync,
+            'raw_frames': self.raw_frames,
+            'upload_manifest': self.upload_manifest,
+            'pending_uploads': self.pending_uploads,
+            'pending_removals': self.pending_removals,
+            'pending_timestamp': self.pending_timestamp,
+            'base_cache': None,
+            'composites': {key: pack_image(frame) for key, frame in self.composites.items()},
+            'rain_samples': self.rain_sensor.samples if self.rain_sensor is not None else {},
+            'stream': self.stream.snapshot() if self.stream is not None else None,
+        }
+        if self.base_cache is not None:
+            key, base_image, legend_area = self.base_cache
+            state['base_cache'] = (key, pack_image(base_image),
+                                   pack_image(legend_area) if legend_area is not None else None)
+
+        try:
+            save_snapshot(self.config['state_file'], state)
+        except Exception as e:
+            logging.warning(f"Could not save state snapshot: {e}")
+
+    def restore_state(self):
+        """Load the working state saved by a previous run, if there is one"""
+        state = load_snapshot(self.config['state_file'])
+        if state is None:
+            return
+
+        try:
+            self.last_frame_set = state['last_frame_set']
+            self.discovery.known = state['discovery_known']
+            self.discovery.cycles_since_sync = state['discovery_cycles_since_sync']
+            self.raw_frames = state['raw_frames']
+            self.upload_manifest = state['upload_manifest']
+            self.pending_uploads = state.get('pending_uploads', [])
+            self.pending_removals = state.get('pending_removals', [])
+            self.pending_timestamp = state.get('pending_timestamp')
+            self.composites = {key: unpack_image(packed) for key, packed in state['composites'].items()}
+            if self.rain_sensor is not None:
+                self.rain_sensor.samples = state['rain_samples']
+            if self.stream is not None and state.get('stream') is not None:
+                self.stream.restore(state['stream'])
+            if state['base_cache'] is not None:
+                key, base_image, legend_area = state['base_cache']
+                self.base_cache = (key, unpack_image(base_image),
+                                   unpack_image(legend_area) if legend_area is not None else None)
+        except Exception as e:
+            logging.warning(f"Ignoring incomplete state snapshot: {e}")
+            self.reset_state()
+            return
+
+        # Outputs made with other settings must be regenerated even if BOM has nothing new
+        if state.get('config_fingerprint') != Config.fingerprint(self.config):
+            logging.info("Configuration changed since the state snapshot was saved - "
+                         "the first cycle will regenerate every output")
+            self.last_frame_set = None
+
+        logging.info(f"Restored state snapshot: {len(self.raw_frames)} raw frames, "
+                     f"{len(self.composites)} composites, "
+                     f"base image {'cached' if self.base_cache else 'not cached'}")
+
+    def apply_config(self, config):
+        """Switch to a reloaded configuration
+
+        Only the state derived from changed settings is rebuilt; downloaded
+        frames, composites and upload records stay warm where they are still valid.
+        """
+        changed = {key for key in config.keys() | self.config.keys() if config.get(key) != self.config.get(key)}
+        if not changed:
+            logging.info("Configuration file changed but none of the settings did")
+            return
+        logging.info(f"Configuration reloaded; changed settings: {', '.join(sorted(changed))}")
+        self.config = config
+
+        def touched(*prefixes):
+            return any(key.startswith(prefixes) for key in changed)
+
+        if touched('layers', 'legend_file', 'product_id'):
+            # The base image and every frame composited on it
+            logging.info("Base image will be rebuilt")
+            self.discard_composites()
+            self.base_cache = None
+
+        if touched('product_id', 'second_radar_', 'third_radar_'):
+            # Placement of radars that are no longer overlaid
+            overlays = [config[f'{name}_radar_product_id'] for name in ('second', 'third')
+                        if config[f'{name}_radar_enabled']]
+            self.reprojector.retain({(config['product_id'], overlay) for overlay in overlays})
+
+        if touched('residential_lat', 'residential_lon', 'rain_sensor_enabled',
+                   'rain_sensor_radius_km', 'rain_sensor_ring_km', 'product_id'):
+            # Only the sampled area changed; the frames already in memory are measured again
+            self.rain_sensor = self.create_rain_sensor()
+            if self.rain_sensor is not None:
+                for filename, data in self.raw_frames.items():
+                    if filename.startswith(f"{config['product_id']}."):
+                        self.sample_rain(filename, data)
+        if touched('residential_') and self.tweener is not None:
+            self.tweener.clear()  # crossfades include the house marker
+
+        if touched('retry_jitter'):
+            for breaker in (self.ftp_breaker, self.smb_breaker):
+                breaker.backoff = Backoff(breaker.backoff.base, breaker.backoff.maximum, config['retry_jitter'])
+
+        if touched('gif_tween_frames'):
+            self.tweener = FrameTweener.from_config(config)
+        if touched('renditions'):
+            self.renditions = load_renditions(config['renditions'])
+        if touched('stream_'):
+            old_stream, self.stream = self.stream, LiveStream.from_config(config)
+            if old_stream is not None:
+                # The new stream starts over; the old segments are no longer referenced
+                expired = old_stream.discard()
+                if self.stream is None or self.stream.playlist != old_stream.playlist:
+                    expired.append(old_stream.playlist)
+                self.pending_uploads = [name for name in self.pending_uploads if name not in expired]
+                self.remove_from_smb(expired)
+        if touched('bundle_'):
+            self.bundle = SpriteBundle.from_config(config)
+            self.bundle_only = self.bundle is not None and config['bundle_upload_only']
+        if touched('grid_export_enabled', 'grid_export_basename'):
+            self.precip_grid = None
+            if config['grid_export_enabled']:
+                self.precip_grid = PrecipitationGrid(config['grid_export_basename'])
+
+        restart = sorted(key for key in changed if key.startswith(RESTART_KEYS))
+        if restart:
+            logging.warning(f"Restart to apply: {', '.join(restart)}")
+
+        # Regenerate the outputs with the new settings even if BOM has nothing new
+        self.last_frame_set = None
+
+    def discard_composites(self):
+        """Forget every composite, e.g. because the base image they were drawn on changed"""
+        self.canvas_pool.release(*self.composites.values(), *self.long_loop_composites.values())
+        self.composites = {}
+        self.long_loop_composites = {}
+        if self.tweener is not None:
+            self.tweener.clear()
+
+    def reset_state(self):
+        """Forget all working state carried between cycles"""
+        # Frames used by the last successful cycle, to skip cycles with nothing new
+        self.last_frame_set = None
+
+        self.base_cache = None      # (key, base_image, legend_area)
+        self.raw_frames = {}        # filename -> raw bytes of recent frames
+        self.composites = {}        # (primary file, overlay files...) -> composited frame
+        self.long_loop_composites = {}  # (timestamp, (overlay product, timestamp)...) -> composited frame
+        self.upload_manifest = {}   # filename -> SHA-256 of the content last uploaded
+        self.pending_uploads = []   # outputs not yet on the SMB share, oldest first
+        self.pending_removals = []  # expired outputs still to be deleted from the SMB share
+        self.pending_timestamp = None
+
+    def create_rain_sensor(self):
+        """Build the rain sensor for the residential location, or None if disabled"""
+        if not self.config['rain_sensor_enabled']:
+            return None
+
+        lat = self.config['residential_lat']
+        lon = self.config['residential_lon']
+        if lat is None or lon is None:
+            logging.warning("Rain sensor enabled but residential location coordinates not provided")
+            return None
+
+        radar_lat, radar_lon, km_per_pixel = self.get_radar_metadata(self.config['product_id'])
+        center = self.latlon_to_pixel(lat, lon, radar_lat, radar_lon, km_per_pixel, (512, 512))
+        return RainSensor(
+            center, km_per_pixel,
+            radius_km=self.config['rain_sensor_radius_km'],
+            ring_km=self.config['rain_sensor_ring_km'],
+        )
+
+    def sample_rain(self, filename, data):
+        """Sample the raw bytes of a primary frame with the rain sensor"""
+        self.rain_sensor.sample(filename, Image.open(io.BytesIO(data)).convert('RGBA'))
+
+    def open_ftp(self):
+        """Return the FTP transport for this cycle
+
+        With a persistent session the previous cycle's connection is health
+        checked and reused; otherwise (or if it has gone away) a fresh
+        transport is created, which connects on first use.
+        """
+        if self.ftp is not None:
+            if self.ftp.is_alive():
+                logging.info("Reusing persistent FTP session")
+                return self.ftp
+            self.ftp = None
+
+        if self.ftp_session is None:
+            self.ftp = FTPTransport.from_config(self.config)
+        else:
+            self.ftp = FTPTransport.from_config(self.config, factory=self.ftp_session.connect)
+        return self.ftp
+
+    def release_ftp(self):
+        """Close the FTP session at the end of a cycle unless it is persistent"""
+        if self.ftp is not None and not self.config['ftp_persistent']:
+            self.ftp.close()
+            self.ftp = None
+
+    def keepalive(self):
+        """Keep a persistent FTP session alive between cycles"""
+        if self.ftp is not None:
+            self.ftp.keepalive()
+
     def load_legend(self):
         """Load the legend image"""
         legend_path = self.config['legend_file']
@@ -270,22 +689,18 @@ class RadarProcessor:
         """Remove top 16px copyright notice from radar image by making it transparent
 
         Args:
-            image: PIL Image object in RGBA mode
+            image: PIL Image object in RGBA mode, modified in place
 
         Returns:
-            PIL Image with top 16px replaced with transparent pixels
+            The same image with top 16px replaced with transparent pixels
         """
-        img = image.copy()
-        width, height = img.size
+        width, height = image.size
 
-        # Create a transparent strip for the top 16 pixels
-        pixels = img.load()
-        for y in range(min(16, height)):
-            for x in range(width):
-                pixels[x, y] = (0, 0, 0, 0)  # Fully transparent
+        # Fill the top 16 pixels with transparency
+        image.paste((0, 0, 0, 0), (0, 0, width, min(16, height)))
 
-        logging.debug(f"Removed copyright (top 16px) from image {img.size}")
-        return img
+        logging.debug(f"Removed copyright (top 16px) from image {image.size}")
+        return image
 
     def make_timestamp_transparent(self, image):
         """Make timestamp text at bottom of image transparent while preserving radar pixels
@@ -295,76 +710,66 @@ class RadarProcessor:
         while preserving any colored radar data that may overlay the timestamp area.
 
         Args:
-            image: PIL Image object in RGBA mode
+            image: PIL Image object in RGBA mode, modified in place
 
         Returns:
-            PIL Image with timestamp text made transparent
+            The same image with timestamp text made transparent
         """
-        img = image.copy()
-        width, height = img.size
-        pixels = img.load()
+        width, height = image.size
 
         # The timestamp text is in the bottom ~20 pixels
         timestamp_region_height = 20
-        start_y = max(0, height - timestamp_region_height)
+        box = (0, max(0, height - timestamp_region_height), width, height)
 
         # Target pure black (RGB 0,0,0) timestamp text
         # Radar data is never this color, so we can safely remove it
-        for y in range(start_y, height):
-            for x in range(width):
-                r, g, b, a = pixels[x, y]
+        # Allow slight tolerance (≤2) for compression artifacts: a pixel is
+        # masked only if all three channels are dark
+        red, green, blue, _ = image.crop(box).split()
+        mask = ImageChops.multiply(
+            ImageChops.multiply(red.point(DARK_LUT), green.point(DARK_LUT)),
+            blue.point(DARK_LUT)
+        )
+        image.paste((0, 0, 0, 0), box, mask)
 
-                # Make black pixels transparent (timestamp text)
-                # Allow slight tolerance (≤2) for compression artifacts
-                if r <= 2 and g <= 2 and b <= 2:
-                    pixels[x, y] = (0, 0, 0, 0)  # Make transparent
+        logging.debug(f"Made timestamp text (RGB 0,0,0) transparent in bottom {timestamp_region_height}px of image {image.size}")
+        return image
 
-        logging.debug(f"Made timestamp text (RGB 0,0,0) transparent in bottom {timestamp_region_height}px of image {img.size}")
-        return img
+    def place_overlay_radar(self, primary_product_id, overlay_product_id):
+        """Prepare the reprojection of an overlay radar into the primary radar's pixel grid
 
-    def calculate_radar_offset(self, primary_product_id, secondary_product_id):
-        """Calculate pixel offset between two radars based on their geographic positions
+        The transform for each radar pair is computed once and cached, taking
+        both radars' scales and latitudes into account.
 
         Args:
             primary_product_id: Product ID of primary radar
-            secondary_product_id: Product ID of secondary radar
+            overlay_product_id: Product ID of overlay radar
 
         Returns:
-            tuple: (offset_x, offset_y) in pixels for positioning secondary radar relative to primary
+            bool: True if the overlay radar overlaps the primary radar
         """
-        # Get metadata for both radars
-        primary_lat, primary_lon, primary_km_per_pixel = self.get_radar_metadata(primary_product_id)
-        secondary_lat, secondary_lon, secondary_km_per_pixel = self.get_radar_metadata(secondary_product_id)
-
-        logging.info(f"Primary radar ({primary_product_id}): lat={primary_lat}, lon={primary_lon}, scale={primary_km_per_pixel}")
-        logging.info(f"Secondary radar ({secondary_product_id}): lat={secondary_lat}, lon={secondary_lon}, scale={secondary_km_per_pixel}")
-
-        # Calculate the geographic distance between the two radar centers
-        # Use the primary radar's scale for pixel conversion
-        R = 6371.0  # Earth's radius in km
-
-        # Convert to radians
-        lat1 = math.radians(primary_lat)
-        lon1 = math.radians(primary_lon)
-        lat2 = math.radians(secondary_lat)
-        lon2 = math.radians(secondary_lon)
-
-        # Calculate distance in km
-        dlat = lat2 - lat1
-        dlon = lon2 - lon1
+        return self.reprojector.prepare(
+            primary_product_id, self.get_radar_metadata(primary_product_id),
+            overlay_product_id, self.get_radar_metadata(overlay_product_id)
+        )
 
-        # Distance in km (north is positive)
-        dy = dlat * R
-        # Distance in km (east is positive)
-        dx = dlon * R * math.cos(lat1)
+    def prepare_overlay_image(self, data, overlay_product_id, size):
+        """Decode an overlay radar frame, strip its text and reproject it
 
-        # Convert km to pixels using primary radar's scale
-        offset_x = int(dx / primary_km_per_pixel)
-        offset_y = -int(dy / primary_km_per_pixel)  # Negative because y increases downward
+        Args:
+            data: Raw PNG bytes of the overlay frame
+            overlay_product_id: Product ID of the overlay radar
+            size: Size of the primary canvas
 
-        logging.info(f"Radar offset: dx={dx:.2f}km, dy={dy:.2f}km -> pixels=({offset_x}, {offset_y})")
+        Returns:
+            PIL Image aligned with the primary radar
+        """
+        image = Image.open(io.BytesIO(data)).convert('RGBA')
 
-        return (offset_x, offset_y)
+        # Process overlay radar image: remove copyright and timestamp
+        image = self.remove_copyright(image)
+        image = self.make_timestamp_transparent(image)
+        return self.reprojector.apply(image, self.config['product_id'], overlay_product_id, size)
 
     def get_timestamp(self, filename):
         """Extract timestamp from filename for sorting"""
@@ -405,10 +810,371 @@ class RadarProcessor:
         
         return None
     
-    def process_images(self):
-        """Main processing function"""
+    def fetch_frame(self, ftp, filename):
+        """Raw bytes of a radar frame, from a local copy if possible
+
+        Recent frames are kept in memory between cycles, and frames
+        downloaded from FTP are added to the archive (when enabled) so they
+        are never downloaded twice.
+        """
+        with self.tracer.span('ftp.retr', file=filename) as span:
+            data = self.raw_frames.get(filename)
+            if data is not None:
+                logging.debug(f"Reusing {filename} from previous cycle")
+                span.set(source='memory', bytes=len(data), **{'cache.hit': True})
+                return data
+
+            source = 'ftp'
+            if self.archive is None:
+                data = ftp.retrieve(filename)
+            else:
+                product_id = filename.split('.')[0]
+                timestamp = self.get_timestamp(filename)
+                data = self.archive.get(product_id, timestamp)
+                if data is not None:
+                    logging.debug(f"Archive hit for {filename}")
+                    source = 'archive'
+                else:
+                    data = ftp.retrieve(filename)
+                    self.archive.put(product_id, timestamp, data)
+
+            span.set(source=source, bytes=len(data), **{'cache.hit': source != 'ftp'})
+            self.raw_frames[filename] = data
+            return data
+
+    def build_base_image(self, ftp, product_id):
+        """Build the base image: the legend with every configured layer on top
+
+        Returns:
+            tuple: (base_image, legend_area, complete) where complete is False if
+            any layer could not be downloaded, or None if there is no legend
+        """
+        # Load the legend image as the base
+        base_image = self.load_legend()
+
+        if base_image is None:
+            logging.error("Cannot proceed without legend image")
+            return None
+
+        # Build composite layers on top of the legend base
+        ftp.cwd('/anon/gen/radar_transparencies/')
+
+        complete = True
+        for layer in self.config['layers']:
+            filename = f"{product_id}.{layer}.png"
+            logging.debug(f"Downloading layer: {layer}")
+            try:
+                with self.tracer.span('ftp.retr', file=filename) as span:
+                    data = ftp.retrieve(filename)
+                    span.set(source='ftp', bytes=len(data), **{'cache.hit': False})
+                file_obj = io.BytesIO(data)
+            except ftplib.all_errors as e:
+                logging.error(f"Error downloading layer {layer}: {e} - continuing without it")
+                complete = False
+                continue
+
+            image = Image.open(file_obj).convert('RGBA')
+            base_image.paste(image, (0, 0), image)
+            logging.debug(f"Added layer: {layer}")
+
+        logging.info(f"Base image with all layers size: {base_image.size}")
+
+        # Save the legend area (bottom 45px) to re-apply after radar compositing
+        # This ensures the legend always appears on top, even if second radar overlaps it
+        legend_height = 45
+        base_width, base_height = base_image.size
+        if base_height > legend_height:
+            legend_area = base_image.crop((0, base_height - legend_height, base_width, base_height))
+            logging.debug(f"Saved legend area: {legend_area.size}")
+        else:
+            legend_area = None
+            logging.warning(f"Base image height ({base_height}) <= legend height ({legend_height}), cannot extract legend")
+
+        return base_image, legend_area, complete
+
+    def composite_frame(self, base_image, legend_area, primary_image, overlays):
+        """Composite a single radar frame
+
+        Args:
+            base_image: Legend with all layers applied
+            legend_area: Bottom strip of the base image re-applied on top, or None
+            primary_image: Primary radar image in RGBA mode
+            overlays: List of (name, image) overlay radars reprojected into the
+                primary radar's pixel grid, bottom layer first. Images may be
+                None for failed downloads.
+
+        Returns:
+            PIL Image of the composited frame
+        """
+        # Start with base image (maintains original size), in a recycled canvas
+        frame = self.canvas_pool.copy(base_image)
+
+        for name, image in overlays:
+            if image is not None:
+                frame.paste(image, (0, 0), image)
+                logging.debug(f"Pasted {name.lower()} radar")
+
+        # Paste primary radar on top (always at 0, 0)
+        frame.paste(primary_image, (0, 0), primary_image)
+
+        # Re-paste legend area on top to ensure it's always visible
+        # This prevents overlay radars from obscuring the legend
+        if legend_area is not None:
+            legend_y = frame.size[1] - legend_area.size[1]
+            frame.paste(legend_area, (0, legend_y), legend_area)
+            logging.debug(f"Re-pasted legend area at bottom")
+
+        return frame
+
+    def add_house_markers(self, frames, house_icon):
+        """Copies of frames with the house marker added (GIF frames only)
+
+        Returns the frames unchanged if there is no house icon.
+        """
+        if house_icon is None:
+            return frames
+
+        logging.info("Adding house markers to GIF frames only")
+        marked = [self.add_house_marker(self.canvas_pool.copy(frame), house_icon) for frame in frames]
+        self.release_after_encode.extend(marked)
+        return marked
+
+    def gif_durations(self, num_frames, steps=0):
+        """Per-frame GIF durations with a longer pause on the last frame
+
+        With steps crossfade frames after each radar frame but the last, every
+        radar frame shares its duration with the crossfades that follow it.
+        """
+        duration = round(self.config['gif_duration'] / (steps + 1))
+        frame_durations = [duration] * max(0, num_frames + (num_frames - 1) * steps)
+        if num_frames > 0:
+            frame_durations[-1] = self.config['gif_last_frame_duration']
+            logging.debug(f"GIF frame durations: {frame_durations}")
+        return frame_durations
+
+    def save_gif(self, gif_frames, gif_filename, steps=0):
+        """Queue frames to be encoded as an animated GIF in the output directory
+
+        The file is written by the encoder pool; the next encoder.wait() reports it.
+
+        Args:
+            gif_frames: Radar frames, each but the last followed by steps crossfade frames
+            gif_filename: Output filename
+            steps: Crossfade frames between radar frames
+        """
+        gif_filepath = os.path.join(self.config['output_directory'], gif_filename)
+        num_frames = (len(gif_frames) + steps) // (steps + 1)
+
+        self.encoder.save_animation(
+            gif_filename,
+            gif_frames,
+            gif_filepath,
+            duration=self.gif_durations(num_frames, steps),
+            loop=self.config['gif_loop'],
+            **self.encoder.gif_params()
+        )
+        tweens = f" with {steps} crossfades between each" if steps else ""
+        logging.info(f"Encoding animated GIF: {gif_filepath} ({num_frames} frames{tweens}, last frame pauses for {self.config['gif_last_frame_duration']}ms)")
+
+    def residential_pixel(self):
+        """Pixel position of the residential location on the primary radar, or None"""
+        lat = self.config['residential_lat']
+        lon = self.config['residential_lon']
+        if not self.config['residential_enabled'] or lat is None or lon is None:
+            return None
+
+        radar_lat, radar_lon, km_per_pixel = self.get_radar_metadata(self.config['product_id'])
+        return self.latlon_to_pixel(lat, lon, radar_lat, radar_lon, km_per_pixel, (512, 512))
+
+    def queue_renditions(self, renditions, frames, gif_frames):
+        """Cut every rendition from the in-memory composites and queue it for encoding
+
+        Args:
+            renditions: List of Rendition objects
+            frames: Composited frames
+            gif_frames: Composited frames with the house marker, used for GIF renditions
+        """
+        if not renditions:
+            return
+
+        center = self.residential_pixel()
+        if center is None:
+            center = (256, 256)
+
+        for rendition in renditions:
+            box = rendition.crop_box(center)
+            if rendition.animated:
+                filename = rendition.filenames(len(gif_frames))[0]
+                images = [rendition.apply(frame, box) for frame in gif_frames]
+                self.encoder.save_animation(
+                    filename, images,
+                    os.path.join(self.config['output_directory'], filename),
+                    duration=self.gif_durations(len(images)),
+                    loop=self.config['gif_loop'],
+                    **self.encoder.gif_params()
+                )
+            else:
+                params = {'format': FORMATS[rendition.format]}
+                if rendition.format == 'png':
+                    params = self.encoder.png_params()
+                for filename, frame in zip(rendition.filenames(len(frames)), frames):
+                    self.encoder.save(
+                        filename, rendition.apply(frame, box),
+                        os.path.join(self.config['output_directory'], filename),
+                        **params
+                    )
+            logging.debug(f"Queued rendition {rendition.name} (crop box {box}, size {rendition.size})")
+
+    def render_long_loop(self, base_image, legend_area, overlay_radars, house_icon=None):
+        """Render a loop longer than BOM's own window from archived frames only
+
+        Each archived primary frame is paired with the latest archived frame of
+        each overlay radar at or before its timestamp. Composites are kept
+        between cycles, so only frames archived since the last cycle are
+        decoded and composited.
+
+        Args:
+            base_image: Legend with all layers applied
+            legend_area: Bottom strip of the base image, or None
+            overlay_radars: List of (name, product_id), bottom layer first
+            house_icon: Optional house marker icon
+        """
+        hours = self.config['archive_long_loop_hours']
+        if hours <= 0:
+            return
+
+        product_id = self.config['product_id']
+        start = (datetime.utcnow() - timedelta(hours=hours)).strftime('%Y%m%d%H%M')
+        timestamps = self.archive.timestamps(product_id, start=start)
+        if len(timestamps) < 2:
+            logging.info("Not enough archived frames yet for the long loop")
+            return
+
+        overlay_timestamps = {
+            overlay_product_id: self.archive.timestamps(overlay_product_id, start=start)
+            for _, overlay_product_id in overlay_radars
+        }
+        overlay_cache = {}
+
+        composites = {}
+        frames = []
+        composited = 0
+        for timestamp in timestamps:
+            overlay_keys = []
+            for name, overlay_product_id in overlay_radars:
+                candidates = [t for t in overlay_timestamps[overlay_product_id] if t <= timestamp]
+                if candidates:
+                    overlay_keys.append((name, (overlay_product_id, candidates[-1])))
+            key = (timestamp,) + tuple(overlay_key for _, overlay_key in overlay_keys)
+
+            if key in self.long_loop_composites:
+                composites[key] = self.long_loop_composites.pop(key)
+                frames.append(composites[key])
+                continue
+
+            data = self.archive.get(product_id, timestamp)
+            if data is None:
+                continue
+            primary_image = Image.open(io.BytesIO(data)).convert('RGBA')
+
+            overlays = []
+            for name, overlay_key in overlay_keys:
+                if overlay_key not in overlay_cache:
+                    overlay_data = self.archive.get(*overlay_key)
+                    image = None
+                    if overlay_data is not None:
+                        image = self.prepare_overlay_image(overlay_data, overlay_key[0], base_image.size)
+                    overlay_cache[overlay_key] = image
+                overlays.append((name, overlay_cache[overlay_key]))
+
+            frame = self.composite_frame(base_image, legend_area, primary_image, overlays)
+            frames.append(frame)
+            composited += 1
+            if all(image is not None for _, image in overlays):
+                composites[key] = frame
+            else:
+                self.release_after_encode.append(frame)
+
+        # Frames that have left the window go back to the pool
+        self.canvas_pool.release(*self.long_loop_composites.values())
+        self.long_loop_composites = composites
+
+        logging.info(f"Rendering {hours}h long loop from {len(frames)} archived frames "
+                     f"({composited} newly composited)")
+        self.save_gif(self.add_house_markers(frames, house_icon), self.config['archive_long_loop_gif'])
+
+    def save_bundle(self, gif_frames):
+        """Queue the loop as a sprite sheet bundle
+
+        Returns:
+            list: Files written directly; the sheet itself is reported by encoder.wait()
+        """
+        sheet = self.bundle.sheet(gif_frames, self.canvas_pool)
+        self.release_after_encode.append(sheet)
+        manifest = self.bundle.manifest(
+            gif_frames[0].size,
+            [self.get_timestamp(key[0]) for key in self.frame_keys],
+            self.gif_durations(len(gif_frames)),
+            self.config['product_id'],
+            self.config['timezone'],
+        )
+        return self.bundle.save(self.encoder, self.config['output_directory'], sheet, manifest)
+
+    def tween_frames(self, gif_frames):
+        """GIF frames with cached crossfades between consecutive radar frames"""
+        # Frames that are not kept as composites can change next cycle, so their crossfades are not cached
+        keys = [key if key in self.composites else None for key in self.frame_keys]
+        with self.tracer.span('tween', frames=len(gif_frames)) as span:
+            blended = self.tweener.stats['blended']
+            frames = self.tweener.interpolate(gif_frames, keys)
+            span.set(**{'pairs.blended': self.tweener.stats['blended'] - blended})
+        return frames
+
+    def update_stream(self, gif_frames):
+        """Encode segments for new frames into the live stream and retire evicted ones"""
+        frames = [(self.get_timestamp(key[0]), frame) for key, frame in zip(self.frame_keys, gif_frames)]
+        with self.tracer.span('stream', frames=len(frames)) as span:
+            written, evicted = self.stream.update(frames)
+            span.set(files=len(written), evicted=len(evicted))
+        self.saved_filenames.extend(written)
+
+        if evicted:
+            # Segments evicted before they reached the share no longer need uploading
+            self.pending_uploads = [name for name in self.pending_uploads if name not in evicted]
+            self.remove_from_smb(evicted)
+
+    def list_frames(self, ftp, product_id, count=5):
+        """Discover the most recent frames of a radar, traced as a listing span"""
+        with self.tracer.span('ftp.list', product=product_id, mode=self.discovery.mode) as span:
+            files = self.discovery.recent_frames(ftp, product_id, count)
+            span.set(frames=len(files))
+            return files
+
+    def run_cycle(self):
+        """Run one traced processing cycle, under the profiler if profiling is enabled"""
+        with self.tracer.cycle() as cycle:
+            if self.profiler is None:
+                success = self.process_images()
+            else:
+                success = self.profiler.run(self.process_images)
+            cycle.set(success=bool(success))
+        return success
+
+    def process_images(self, renditions=None):
+        """Main processing function
+
+        Args:
+            renditions: Optional list of Rendition objects to produce in
+                addition to the standard outputs. Defaults to the configured
+                renditions.
+        """
         self.frames = []
+        self.frame_keys = []
         self.saved_filenames = []
+        self.metrics['cycles'] += 1
+
+        if renditions is None:
+            renditions = self.renditions
 
         product_id = self.config['product_id']
         second_radar_enabled = self.config.get('second_radar_enabled', False)
@@ -416,13 +1182,46 @@ class RadarProcessor:
         third_radar_enabled = self.config.get('third_radar_enabled', False)
         third_radar_product_id = self.config.get('third_radar_product_id')
 
+        if not self.ftp_breaker.allow():
+            logging.warning(f"BOM FTP is unavailable - not contacting it for another "
+                            f"{self.ftp_breaker.retry_in():.0f}s")
+            self.flush_pending_uploads()
+            return False
+
+        if self.ftp_session is not None:
+            self.ftp_session.begin_cycle()
+
         try:
-            # Load the legend image as the base
-            base_image = self.load_legend()
+            # Connect to FTP server (operations retry and reconnect on transient errors)
+            ftp = self.open_ftp()
 
-            if base_image is None:
-                logging.error("Cannot proceed without legend image")
-                return False
+            # Find the most recent 5 radar images for each radar
+            ftp.cwd('/anon/gen/radar/')
+            self.discovery.begin_cycle()
+
+            files = self.list_frames(ftp, product_id)
+            self.ftp_breaker.record_success()
+
+            second_files = []
+            if second_radar_enabled and second_radar_product_id:
+                logging.info(f"Second radar enabled: {second_radar_product_id}")
+                second_files = self.list_frames(ftp, second_radar_product_id)
+
+            third_files = []
+            if third_radar_enabled and third_radar_product_id:
+                logging.info(f"Third radar enabled: {third_radar_product_id}")
+                third_files = self.list_frames(ftp, third_radar_product_id)
+
+            # Nothing to do if BOM has not published anything since the last successful cycle
+            frame_set = (tuple(files), tuple(second_files), tuple(third_files))
+            if files and frame_set == self.last_frame_set:
+                self.metrics['cycles_skipped'] += 1
+                self.tracer.annotate(skipped=True)
+                self.flush_pending_uploads()
+                logging.info(f"No new radar frames since the last successful cycle - skipping "
+                             f"compositing, encoding and upload "
+                             f"({self.metrics['cycles_skipped']} of {self.metrics['cycles']} cycles skipped)")
+                return True
 
             # Load house icon if residential location is enabled
             house_icon = None
@@ -434,345 +1233,452 @@ class RadarProcessor:
                 else:
                     logging.warning("Could not load house icon, marker will be disabled")
 
-            # Connect to FTP server
-            logging.info("Connecting to BOM FTP server...")
-            ftp = ftplib.FTP('ftp.bom.gov.au')
-            ftp.login()
-
-            # Build composite layers on top of the legend base
-            ftp.cwd('anon/gen/radar_transparencies/')
-
-            for layer in self.config['layers']:
-                filename = f"{product_id}.{layer}.png"
-                logging.debug(f"Downloading layer: {layer}")
-                file_obj = io.BytesIO()
-                ftp.retrbinary('RETR ' + filename, file_obj.write)
-                file_obj.seek(0)
-
-                image = Image.open(file_obj).convert('RGBA')
-                base_image.paste(image, (0, 0), image)
-                logging.debug(f"Added layer: {layer}")
-
-            logging.info(f"Base image with all layers size: {base_image.size}")
-
-            # Save the legend area (bottom 45px) to re-apply after radar compositing
-            # This ensures the legend always appears on top, even if second radar overlaps it
-            legend_height = 45
-            base_width, base_height = base_image.size
-            if base_height > legend_height:
-                legend_area = base_image.crop((0, base_height - legend_height, base_width, base_height))
-                logging.debug(f"Saved legend area: {legend_area.size}")
+            # Reuse the base image from earlier cycles unless something it depends on changed
+            base_key = (product_id, tuple(self.config['layers']), self.config['legend_file'])
+            if self.base_cache is not None and self.base_cache[0] == base_key:
+                _, base_image, legend_area = self.base_cache
+                logging.info("Reusing base image with layers from previous cycle")
             else:
-                legend_area = None
-                logging.warning(f"Base image height ({base_height}) <= legend height ({legend_height}), cannot extract legend")
+                with self.tracer.span('base_image', product=product_id):
+                    built = self.build_base_image(ftp, product_id)
+                if built is None:
+                    return False
+                base_image, legend_area, complete = built
 
-            # Get radar images
+                # Composites made on the old base image are no longer valid
+                self.discard_composites()
+                self.base_cache = (base_key, base_image, legend_area) if complete else None
+
+            # Download radar images
             ftp.cwd('/anon/gen/radar/')
 
-            # Get all matching radar files for primary radar
-            all_files = [file for file in ftp.nlst()
-                         if file.startswith(product_id)
-                         and file.endswith('.png')]
+            # Overlay radars and their placement, bottom layer first:
+            # third radar goes below the second radar, both below the primary
+            overlay_radars = []
+            if third_radar_enabled and third_radar_product_id and third_files:
+                if self.place_overlay_radar(product_id, third_radar_product_id):
+                    overlay_radars.append(('Third', third_radar_product_id, third_files))
+            if second_radar_enabled and second_radar_product_id and second_files:
+                if self.place_overlay_radar(product_id, second_radar_product_id):
+                    overlay_radars.append(('Second', second_radar_product_id, second_files))
+
+            cycle_composites = []
+
+            def download(i):
+                """Stage 1: raw bytes of primary frame i and the matching overlay frames"""
+                file = files[i]
+                key = (file,) + tuple(overlay_files[i] if i < len(overlay_files) else None
+                                      for _, _, overlay_files in overlay_radars)
+                cycle_composites.append(key)
+                if key in self.composites:
+                    # Composited in an earlier cycle; at most the rain sensor still needs the frame
+                    if self.rain_sensor is not None and file not in self.rain_sensor.samples:
+                        try:
+                            self.sample_rain(file, self.fetch_frame(ftp, file))
+                        except ftplib.all_errors as e:
+                            logging.error(f"Error downloading {file} for the rain sensor: {e}")
+                    return key, None, None
 
-            # Sort by timestamp
-            sorted_files = sorted(all_files, key=self.get_timestamp)
+                logging.debug(f"Processing primary radar {file}")
+                try:
+                    primary_data = self.fetch_frame(ftp, file)
+                except ftplib.all_errors as e:
+                    logging.error(f"Error downloading {file}: {e}")
+                    return None
+
+                overlay_data = []
+                for name, _, overlay_files in overlay_radars:
+                    data = None
+                    if i < len(overlay_files):
+                        try:
+                            data = self.fetch_frame(ftp, overlay_files[i])
+                        except ftplib.all_errors as e:
+                            logging.error(f"Error downloading {name.lower()} radar {overlay_files[i]}: {e}")
+                    overlay_data.append(data)
+                return key, primary_data, overlay_data
+
+            def composite(item):
+                """Stage 2: decode the downloaded frames and composite them"""
+                key, primary_data, overlay_data = item
+                file = key[0]
+                with self.tracer.span('composite', file=file, **{'cache.hit': primary_data is None}):
+                    if primary_data is None:
+                        frame = self.composites[key]
+                        self.frames.append(frame)
+                        self.frame_keys.append(key)
+                        logging.debug(f"Reusing composite of {file} from previous cycle")
+                        return frame
+
+                    primary_image = Image.open(io.BytesIO(primary_data)).convert('RGBA')
+                    if self.rain_sensor is not None:
+                        self.rain_sensor.sample(file, primary_image)
+
+                    overlays = []
+                    for (name, overlay_product_id, _), data in zip(overlay_radars, overlay_data):
+                        image = None
+                        if data is not None:
+                            image = self.prepare_overlay_image(data, overlay_product_id, base_image.size)
+                        overlays.append((name, image))
+
+                    frame = self.composite_frame(base_image, legend_area, primary_image, overlays)
+                    self.frames.append(frame)
+                    self.frame_keys.append(key)
 
-            # Get the last 5 (most recent) radar images
-            files = sorted_files[-5:]
+                    # Only composites with every expected overlay are worth keeping
+                    if all(data is not None for name, data in zip(key[1:], overlay_data) if name is not None):
+                        self.composites[key] = frame
+                    logging.debug(f"Successfully processed {file}")
+                    return frame
 
-            logging.info(f"Found {len(all_files)} total radar files for primary radar")
-            logging.info(f"Selected most recent 5: {[f.split('.')[2] for f in files]}")
+            frame_numbers = itertools.count(1)
 
-            # Download second radar images if enabled
-            second_radar_images = []
-            if second_radar_enabled and second_radar_product_id:
-                logging.info(f"Second radar enabled: {second_radar_product_id}")
+            def encode(frame):
+                """Stage 3: hand the individual PNG image (without house marker) to the encoder pool"""
+                filename = f"image_{next(frame_numbers)}.png"
+                filepath = os.path.join(self.config['output_directory'], filename)
+                return filename, self.encoder.encode(frame, filepath, **self.encoder.png_params())
 
-                # Get all matching files for second radar
-                all_second_files = [file for file in ftp.nlst()
-                                   if file.startswith(second_radar_product_id)
-                                   and file.endswith('.png')]
-
-                # Sort by timestamp
-                sorted_second_files = sorted(all_second_files, key=self.get_timestamp)
-
-                # Get the last 5 (most recent) radar images
-                second_files = sorted_second_files[-5:]
-
-                logging.info(f"Found {len(all_second_files)} total files for second radar")
-                logging.info(f"Selected most recent 5: {[f.split('.')[2] for f in second_files]}")
-
-                # Download second radar images
-                for file in second_files:
-                    logging.debug(f"Processing second radar {file}")
-                    file_obj = io.BytesIO()
-                    try:
-                        ftp.retrbinary('RETR ' + file, file_obj.write)
-                        file_obj.seek(0)
-                        image = Image.open(file_obj).convert('RGBA')
-
-                        # Process second radar image: remove copyright and timestamp
-                        image = self.remove_copyright(image)
-                        image = self.make_timestamp_transparent(image)
-
-                        second_radar_images.append(image)
-                        logging.debug(f"Successfully processed second radar {file}")
-                    except ftplib.all_errors as e:
-                        logging.error(f"Error downloading second radar {file}: {e}")
-                        second_radar_images.append(None)  # Placeholder for failed download
-
-                # Calculate offset for second radar positioning
-                if second_radar_images:
-                    offset_x, offset_y = self.calculate_radar_offset(product_id, second_radar_product_id)
-                    logging.info(f"Second radar will be offset by ({offset_x}, {offset_y}) pixels")
-
-            # Download third radar images if enabled
-            third_radar_images = []
-            if third_radar_enabled and third_radar_product_id:
-                logging.info(f"Third radar enabled: {third_radar_product_id}")
+            smb_session = {}
 
-                # Get all matching files for third radar
-                all_third_files = [file for file in ftp.nlst()
-                                   if file.startswith(third_radar_product_id)
-                                   and file.endswith('.png')]
-
-                # Sort by timestamp
-                sorted_third_files = sorted(all_third_files, key=self.get_timestamp)
-
-                # Get the last 5 (most recent) radar images
-                third_files = sorted_third_files[-5:]
-
-                logging.info(f"Found {len(all_third_files)} total files for third radar")
-                logging.info(f"Selected most recent 5: {[f.split('.')[2] for f in third_files]}")
-
-                # Download third radar images
-                for file in third_files:
-                    logging.debug(f"Processing third radar {file}")
-                    file_obj = io.BytesIO()
-                    try:
-                        ftp.retrbinary('RETR ' + file, file_obj.write)
-                        file_obj.seek(0)
-                        image = Image.open(file_obj).convert('RGBA')
-
-                        # Process third radar image: remove copyright and timestamp
-                        image = self.remove_copyright(image)
-                        image = self.make_timestamp_transparent(image)
-
-                        third_radar_images.append(image)
-                        logging.debug(f"Successfully processed third radar {file}")
-                    except ftplib.all_errors as e:
-                        logging.error(f"Error downloading third radar {file}: {e}")
-                        third_radar_images.append(None)  # Placeholder for failed download
-
-                # Calculate offset for third radar positioning
-                if third_radar_images:
-                    third_offset_x, third_offset_y = self.calculate_radar_offset(product_id, third_radar_product_id)
-                    logging.info(f"Third radar will be offset by ({third_offset_x}, {third_offset_y}) pixels")
-
-            # Download and composite the primary radar images
-            for i, file in enumerate(files):
-                logging.debug(f"Processing primary radar {file}")
-                file_obj = io.BytesIO()
+            def upload(item):
+                """Stage 4: wait for the PNG image to be written, then copy it to the SMB share"""
+                filename, future = item
                 try:
-                    ftp.retrbinary('RETR ' + file, file_obj.write)
-                    file_obj.seek(0)
-                    primary_image = Image.open(file_obj).convert('RGBA')
-
-                    # Start with base image (maintains original size)
-                    frame = base_image.copy()
-
-                    # If third radar is enabled, check for overlap and composite if needed
-                    # Third radar goes first (bottom layer)
-                    if third_radar_enabled and third_radar_images and i < len(third_radar_images):
-                        third_image = third_radar_images[i]
-
-                        if third_image is not None:
-                            # Check if third radar overlaps with primary radar
-                            # Primary radar: (0, 0) to (512, 512)
-                            # Third radar: (third_offset_x, third_offset_y) to (third_offset_x + 512, third_offset_y + 512)
-                            RADAR_SIZE = 512
-
-                            # Rectangles overlap if they intersect
-                            overlaps = (
-                                third_offset_x < RADAR_SIZE and (third_offset_x + RADAR_SIZE) > 0 and
-                                third_offset_y < RADAR_SIZE and (third_offset_y + RADAR_SIZE) > 0
-                            )
-
-                            if overlaps:
-                                # Paste third radar first (it should be at the bottom)
-                                # PIL will automatically clip if it extends beyond canvas
-                                frame.paste(third_image, (third_offset_x, third_offset_y), third_image)
-                                logging.debug(f"Pasted third radar at ({third_offset_x}, {third_offset_y}) - overlaps with primary")
-                            else:
-                                logging.warning(f"Third radar at offset ({third_offset_x}, {third_offset_y}) does not overlap with primary radar - skipping")
-
-                    # If second radar is enabled, check for overlap and composite if needed
-                    # Second radar goes on top of third radar (middle layer)
-                    if second_radar_enabled and second_radar_images and i < len(second_radar_images):
-                        second_image = second_radar_images[i]
-
-                        if second_image is not None:
-                            # Check if second radar overlaps with primary radar
-                            # Primary radar: (0, 0) to (512, 512)
-                            # Second radar: (offset_x, offset_y) to (offset_x + 512, offset_y + 512)
-                            RADAR_SIZE = 512
-
-                            # Rectangles overlap if they intersect
-                            overlaps = (
-                                offset_x < RADAR_SIZE and (offset_x + RADAR_SIZE) > 0 and
-                                offset_y < RADAR_SIZE and (offset_y + RADAR_SIZE) > 0
-                            )
-
-                            if overlaps:
-                                # Paste second radar (it should be below primary but above third)
-                                # PIL will automatically clip if it extends beyond canvas
-                                frame.paste(second_image, (offset_x, offset_y), second_image)
-                                logging.debug(f"Pasted second radar at ({offset_x}, {offset_y}) - overlaps with primary")
-                            else:
-                                logging.warning(f"Second radar at offset ({offset_x}, {offset_y}) does not overlap with primary radar - skipping")
-
-                    # Paste primary radar on top (always at 0, 0)
-                    frame.paste(primary_image, (0, 0), primary_image)
-
-                    # Re-paste legend area on top to ensure it's always visible
-                    # This prevents second radar from obscuring the legend
-                    if legend_area is not None:
-                        legend_y = base_height - legend_height
-                        frame.paste(legend_area, (0, legend_y), legend_area)
-                        logging.debug(f"Re-pasted legend area at bottom")
+                    size = future.result()
+                except Exception as e:
+                    logging.error(f"Failed to encode {filename}: {e}")
+                    return None
+                self.saved_filenames.append(filename)
+                logging.debug(f"Saved {filename} ({size} bytes)")
+                if self.bundle_only:
+                    return filename  # delivered in the bundle instead
+
+                # Left for transfer_to_smb, which queues it while the share is unavailable
+                if not self.smb_breaker.allow():
+                    return None
+                if 'path' not in smb_session:
+                    smb_session['path'] = self.smb_destination()
+                if self.upload_file(smb_session['path'], filename):
+                    return filename
+                return None
 
-                    self.frames.append(frame)
-                    logging.debug(f"Successfully processed {file}")
-                except ftplib.all_errors as e:
-                    logging.error(f"Error downloading {file}: {e}")
+            pipeline = Pipeline([
+                ('download', download),
+                ('composite', composite),
+                ('encode', encode),
+                ('upload', upload),
+            ], queue_size=self.config['pipeline_queue_size'])
+            uploaded = pipeline.run(range(len(files)))
 
-            ftp.quit()
-            logging.info("Disconnected from FTP server")
+            self.release_ftp()
             
             if not self.frames:
                 logging.error("No frames were processed")
                 return False
-            
-            # Save individual PNG images (without house marker)
-            for i, img in enumerate(self.frames):
-                filename = f"image_{i+1}.png"
-                filepath = os.path.join(self.config['output_directory'], filename)
-                img.save(filepath)
-                self.saved_filenames.append(filename)
-                logging.debug(f"Saved {filepath}")
 
             logging.info(f"Saved {len(self.saved_filenames)} PNG images")
 
             # Create GIF frames with house marker (if enabled)
-            gif_frames = []
-            if house_icon is not None:
-                logging.info("Adding house markers to GIF frames only")
-                for frame in self.frames:
-                    gif_frame = frame.copy()
-                    gif_frame = self.add_house_marker(gif_frame, house_icon)
-                    gif_frames.append(gif_frame)
+            gif_frames = self.add_house_markers(self.frames, house_icon)
+
+            # Renditions encode in the worker pool alongside the GIF
+            self.queue_renditions(renditions, self.frames, gif_frames)
+
+            # Save animated GIF (with house marker and crossfades, if enabled)
+            if self.tweener is None:
+                self.save_gif(gif_frames, self.config['animated_gif_filename'])
             else:
-                gif_frames = self.frames
-
-            # Save animated GIF
-            gif_filepath = os.path.join(
-                self.config['output_directory'],
-                self.config['animated_gif_filename']
-            )
-
-            # Create duration list with longer pause on last frame
-            num_frames = len(gif_frames)
-            frame_durations = [self.config['gif_duration']] * num_frames
-            if num_frames > 0:
-                frame_durations[-1] = self.config['gif_last_frame_duration']
-                logging.debug(f"GIF frame durations: {frame_durations}")
-
-            gif_frames[0].save(
-                gif_filepath,
-                save_all=True,
-                append_images=gif_frames[1:],
-                duration=frame_durations,
-                loop=self.config['gif_loop'],
-                optimize=False
-            )
-            self.saved_filenames.append(self.config['animated_gif_filename'])
-            logging.info(f"Saved animated GIF: {gif_filepath} ({num_frames} frames, last frame pauses for {self.config['gif_last_frame_duration']}ms)")
+                self.save_gif(self.tween_frames(gif_frames), self.config['animated_gif_filename'],
+                              self.tweener.steps)
+
+            # The whole loop as one file (optional)
+            if self.bundle is not None:
+                self.saved_filenames.extend(self.save_bundle(gif_frames))
+
+            # Render the long loop from the local archive
+            if self.archive is not None:
+                self.render_long_loop(
+                    base_image, legend_area,
+                    [(name, overlay_product_id) for name, overlay_product_id, _ in overlay_radars],
+                    house_icon
+                )
+                self.archive.prune()
+
+            # Append the new frames to the live stream before their canvases are recycled
+            if self.stream is not None:
+                self.update_stream(gif_frames)
+
+            # Wait for the GIFs and renditions being encoded in the worker pool
+            encoded_files = self.encoder.wait()
+            self.canvas_pool.release(*self.release_after_encode)
+            self.release_after_encode = []
+            self.saved_filenames.extend(encoded_files)
+            logging.info(f"Saved {len(encoded_files)} GIF and rendition files")
+
+            # Rain-at-location sensor from the frames sampled while compositing
+            if self.rain_sensor is not None:
+                sensor_filename = self.config['rain_sensor_filename']
+                self.rain_sensor.write(os.path.join(self.config['output_directory'], sensor_filename), files)
+                self.saved_filenames.append(sensor_filename)
+
+            # Decoded intensity levels of the raw primary frames
+            if self.precip_grid is not None:
+                radar_lat, radar_lon, km_per_pixel = self.get_radar_metadata(product_id)
+                grid_files = self.precip_grid.write(
+                    self.config['output_directory'], files, self.raw_frames,
+                    {'product_id': product_id, 'latitude': radar_lat, 'longitude': radar_lon,
+                     'km_per_pixel': km_per_pixel}
+                )
+                if self.config['grid_export_upload']:
+                    self.saved_filenames.extend(grid_files)
             
             # Extract timestamp from last radar file
             timestamp_content = self.parse_timestamp(files[-1]) if files else None
             
-            # Transfer to SMB share
-            self.transfer_to_smb(timestamp_content)
-            
+            # Transfer the remaining files (and any PNG the pipeline failed to upload)
+            remaining = [name for name in self.saved_filenames if name not in uploaded]
+            if self.bundle_only:
+                # The bundle manifest carries the frame times, so the GIF and timestamp file stay local
+                remaining = [name for name in remaining if name != self.config['animated_gif_filename']]
+                timestamp_content = None
+            self.transfer_to_smb(timestamp_content, remaining)
+
+            # Only a complete loop lets the next cycle skip; a degraded one is retried
+            if len(cycle_composites) == len(files) and all(key in self.composites for key in cycle_composites):
+                self.last_frame_set = frame_set
+            else:
+                self.last_frame_set = None
+                logging.warning("Some radar frames could not be downloaded or composited - "
+                                "the next cycle will try again")
+
+            # Only this cycle's frames can be reused by the next one
+            self.canvas_pool.release(*[frame for key, frame in self.composites.items() if key not in cycle_composites])
+            self.composites = {key: frame for key, frame in self.composites.items() if key in cycle_composites}
+            cycle_files = {file for file_list in frame_set for file in file_list}
+            self.raw_frames = {file: data for file, data in self.raw_frames.items() if file in cycle_files}
+
+            if self.config['state_enabled']:
+                self.save_state()
+
             return True
             
         except ftplib.all_errors as e:
             logging.error(f"FTP Error: {e}")
+            self.ftp_breaker.record_failure()
             return False
         except Exception as e:
             logging.error(f"Unexpected error: {e}")
             import traceback
             traceback.print_exc()
             return False
+        finally:
+            self.release_ftp()
+            if self.ftp_session is not None:
+                self.ftp_session.end_cycle()
     
-    def transfer_to_smb(self, timestamp_content):
-        """Transfer files to SMB share"""
-        if not self.saved_filenames:
+    def smb_destination(self):
+        """Configure the SMB client and create the destination directory
+
+        Returns:
+            str: SMB path of the destination directory
+        """
+        # Configure SMB client
+        smbclient.ClientConfig(
+            username=self.config['smb_username'],
+            password=self.config['smb_password']
+        )
+        
+        # Build SMB destination path
+        smb_destination_path = (
+            f"//{self.config['smb_server']}/{self.config['smb_share']}"
+            f"{self.config['smb_remote_path']}"
+        )
+        
+        # Create destination directory
+        try:
+            smbclient.makedirs(smb_destination_path, exist_ok=True)
+        except Exception as e:
+            logging.warning(f"Could not create directory: {e}")
+
+        return smb_destination_path
+
+    def remote_size(self, smb_file_path):
+        """Size of a file on the SMB share, or None if it is not there"""
+        try:
+            return smbclient.stat(smb_file_path).st_size
+        except Exception:
+            return None
+
+    def upload_file(self, smb_destination_path, file_name):
+        """Copy one file from the output directory to the SMB share
+
+        Returns:
+            bool: True if the file was transferred
+        """
+        if not self.smb_breaker.allow():
+            return False
+
+        local_file_path = os.path.join(self.config['output_directory'], file_name)
+        smb_file_path = f"{smb_destination_path}/{file_name}"
+        
+        logging.debug(f"Transferring {file_name}...")
+        span = self.tracer.start_span('smb.write', file=file_name)
+        try:
+            with open(local_file_path, 'rb') as local_file:
+                data = local_file.read()
+            span.set(bytes=len(data))
+
+            # A file written again is no longer expired
+            if file_name in self.pending_removals:
+                self.pending_removals.remove(file_name)
+
+            # Skip files whose content is already on the share (and still there)
+            digest = hashlib.sha256(data).hexdigest()
+            if self.upload_manifest.get(file_name) == digest and self.remote_size(smb_file_path) == len(data):
+                logging.debug(f"{file_name} is unchanged on the SMB share - skipping")
+                self.tracer.end_span(span, **{'cache.hit': True})
+                return True
+
+            with smbclient.open_file(smb_file_path, mode="wb") as smb_file:
+                smb_file.write(data)
+            self.upload_manifest[file_name] = digest
+            self.smb_breaker.record_success()
+            logging.debug(f"Successfully transferred {file_name}")
+            self.tracer.end_span(span, **{'cache.hit': False})
+            return True
+        except Exception as e:
+            logging.error(f"Failed to transfer {file_name}: {e}")
+            self.smb_breaker.record_failure()
+            self.tracer.end_span(span, error=e)
+            return False
+
+    def transfer_to_smb(self, timestamp_content, filenames=None):
+        """Transfer files to SMB share
+
+        Files that cannot be transferred (or all of them while the share is
+        unavailable) are queued and go out with the next transfer, so an SMB
+        outage does not require redoing the cycle.
+
+        Args:
+            timestamp_content: Contents of the timestamp file, or None
+            filenames: Files to transfer; defaults to every file saved this cycle
+        """
+        if filenames is None:
+            filenames = self.saved_filenames
+
+        # Outputs queued during an outage go first
+        filenames = [name for name in self.pending_uploads if name not in filenames] + list(filenames)
+        if timestamp_content is None:
+            timestamp_content = self.pending_timestamp
+
+        if not filenames and not timestamp_content:
             logging.warning("No files to transfer")
             return
-        
+
+        if not self.smb_breaker.allow():
+            self.pending_uploads, self.pending_timestamp = filenames, timestamp_content
+            logging.warning(f"SMB share is unavailable - {len(filenames)} files queued until it recovers "
+                            f"(next attempt in {self.smb_breaker.retry_in():.0f}s)")
+            return
+
+        failed = filenames
         try:
-            # Configure SMB client
-            smbclient.ClientConfig(
-                username=self.config['smb_username'],
-                password=self.config['smb_password']
-            )
-            
-            # Build SMB destination path
-            smb_destination_path = (
-                f"//{self.config['smb_server']}/{self.config['smb_share']}"
-                f"{self.config['smb_remote_path']}"
-            )
-            
-            # Create destination directory
-            try:
-                smbclient.makedirs(smb_destination_path, exist_ok=True)
-            except Exception as e:
-                logging.warning(f"Could not create directory: {e}")
+            smb_destination_path = self.smb_destination()
             
             # Transfer each saved file
-            for file_name in self.saved_filenames:
-                local_file_path = os.path.join(self.config['output_directory'], file_name)
-                smb_file_path = f"{smb_destination_path}/{file_name}"
-                
-                logging.debug(f"Transferring {file_name}...")
-                try:
-                    with open(local_file_path, 'rb') as local_file:
-                        with smbclient.open_file(smb_file_path, mode="wb") as smb_file:
-                            smb_file.write(local_file.read())
-                    logging.debug(f"Successfully transferred {file_name}")
-                except Exception as e:
-                    logging.error(f"Failed to transfer {file_name}: {e}")
+            failed = [file_name for file_name in filenames
+                      if not self.upload_file(smb_destination_path, file_name)]
             
-            logging.info(f"Transferred {len(self.saved_filenames)} files to SMB share")
+            logging.info(f"Transferred {len(filenames) - len(failed)} files to SMB share")
             
-            # Write timestamp file
-            if timestamp_content:
+            # Write timestamp file once the images it describes are on the share
+            if timestamp_content and not failed:
                 timestamp_file_path = f"{smb_destination_path}/{self.config['timestamp_filename']}"
                 try:
                     with smbclient.open_file(timestamp_file_path, mode="w") as timestamp_file:
                         timestamp_file.write(timestamp_content)
+                    self.smb_breaker.record_success()
+                    timestamp_content = None
                     logging.info(f"Successfully wrote timestamp file")
                 except Exception as e:
                     logging.error(f"Failed to write timestamp file: {e}")
+                    self.smb_breaker.record_failure()
                     
         except smbclient.exceptions.SMBException as e:
             logging.error(f"SMB Error: {e}")
+            self.smb_breaker.record_failure()
         except Exception as e:
             logging.error(f"Transfer error: {e}")
+            self.smb_breaker.record_failure()
+        finally:
+            smbclient.reset_connection_cache()
+
+        self.pending_uploads, self.pending_timestamp = failed, timestamp_content
+        if failed or timestamp_content:
+            logging.warning(f"{len(failed)} files queued for the next SMB transfer")
+
+    def remove_from_smb(self, filenames=()):
+        """Delete files that are no longer referenced from the SMB share
+
+        Files that cannot be deleted now (e.g. while the share is unavailable)
+        are queued and retried with the next removal or queued upload.
+        """
+        removable = self.pending_removals + [name for name in filenames
+                                             if name in self.upload_manifest and name not in self.pending_removals]
+        self.pending_removals = removable
+        if not removable or not self.smb_breaker.allow():
+            return
+
+        failed = []
+        try:
+            smb_destination_path = self.smb_destination()
+            for file_name in removable:
+                try:
+                    smbclient.remove(f"{smb_destination_path}/{file_name}")
+                except OSError as e:
+                    if e.errno != errno.ENOENT:
+                        logging.debug(f"Could not remove {file_name} from the SMB share: {e}")
+                        failed.append(file_name)
+                        continue
+                self.upload_manifest.pop(file_name, None)
+            logging.debug(f"Removed {len(removable) - len(failed)} expired files from the SMB share")
+        except Exception as e:
+            logging.error(f"Could not remove expired files from the SMB share: {e}")
+            failed = removable
         finally:
             smbclient.reset_connection_cache()
 
+        if failed:
+            self.smb_breaker.record_failure()
+            logging.warning(f"{len(failed)} expired files queued for removal from the SMB share")
+        self.pending_removals = failed
+
+    def flush_pending_uploads(self):
+        """Retry outputs (and removals) queued while the SMB share was unavailable"""
+        if not self.smb_breaker.allow():
+            return
+        if self.pending_uploads or self.pending_timestamp:
+            logging.info(f"Retrying {len(self.pending_uploads)} queued SMB uploads")
+            self.transfer_to_smb(None, [])
+        if self.pending_removals:
+            self.remove_from_smb()
+
+
+async def idle(processor, seconds):
+    """Sleep between cycles, sending FTP keepalives if the session is persistent"""
+    interval = processor.config['ftp_keepalive_interval']
+    if not processor.config['ftp_persistent'] or interval <= 0:
+        await asyncio.sleep(seconds)
+        return
+
+    remaining = seconds
+    while remaining > 0:
+        step = min(interval, remaining)
+        await asyncio.sleep(step)
+        remaining -= step
+        if remaining > 0:
+            processor.keepalive()
+
 
 async def main():
     """Main application entry point with continuous scheduling"""
@@ -808,30 +1714,51 @@ async def main():
     
     # Initialize processor
     processor = RadarProcessor(config)
+    config_modified = Config.modified()
     
     # Run continuously or once
     if config['scheduler_enabled']:
         run_count = 0
+
+        # Retries after failed cycles back off exponentially, with jitter
+        retry_backoff = Backoff(config['retry_interval'], config['retry_interval_max'], config['retry_jitter'])
+        failures = 0
+
         while True:
             run_count += 1
-            logging.info(f'=== Starting radar image processing (run #{run_count}) ===')
             
             try:
-                success = processor.process_images()
+                # Pick up changes to config.yaml without a restart
+                modified = Config.modified()
+                if config['config_reload'] and modified != config_modified:
+                    config_modified = modified
+                    reloaded = Config.reload()
+                    if reloaded is not None:
+                        processor.apply_config(reloaded)
+                        config = processor.config
+                        retry_backoff = Backoff(config['retry_interval'], config['retry_interval_max'],
+                                                config['retry_jitter'])
+
+                logging.info(f'=== Starting radar image processing (run #{run_count}) ===')
+                
+                success = processor.run_cycle()
                 
                 if success:
                     logging.info('Radar processing completed successfully')
+                    failures = 0
                     sleep_time = config['update_interval']
                 else:
                     logging.error('Radar processing failed')
+                    failures += 1
                     if config['retry_on_error']:
-                        sleep_time = config['retry_interval']
+                        # No point waking up before BOM FTP may be tried again
+                        sleep_time = round(max(retry_backoff.delay(failures - 1), processor.ftp_breaker.retry_in()))
                         logging.info(f'Will retry in {sleep_time} seconds')
                     else:
                         sleep_time = config['update_interval']
                 
                 logging.info(f'Next update in {sleep_time} seconds ({sleep_time/60:.1f} minutes)')
-                await asyncio.sleep(sleep_time)
+                await idle(processor, sleep_time)
                 
             except KeyboardInterrupt:
                 logging.info('Shutdown requested')
@@ -841,16 +1768,20 @@ async def main():
                 import traceback
                 traceback.print_exc()
                 
+                failures += 1
                 if config['retry_on_error']:
-                    sleep_time = config['retry_interval']
+                    sleep_time = round(retry_backoff.delay(failures - 1))
                     logging.info(f'Retrying in {sleep_time} seconds')
-                    await asyncio.sleep(sleep_time)
+                    await idle(processor, sleep_time)
                 else:
                     break
     else:
         # Run once and exit
         logging.info('Running single processing cycle')
-        processor.process_images()
+        processor.run_cycle()
+        if processor.ftp is not None:
+            processor.ftp.close()
+        processor.encoder.shutdown()
         logging.info('Processing complete, exiting')
 
 
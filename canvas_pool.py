@@ -0,0 +1,50 @@
+"""
+Reusable image canvases
+
+Every composite frame and every GIF frame with the house marker is a full
+size RGBA image (about 1.1MB for a 512x557 frame). Allocating fresh ones each
+cycle churns memory on small hosts, so canvases that are no longer needed
+(composites that have left the loop, GIF frames once they are encoded) are
+returned to a pool and overwritten in place by the next frame instead.
+"""
+import threading
+
+from PIL import Image
+
+
+class CanvasPool:
+    """Pool of released images, reused for new images of the same mode and size"""
+
+    def __init__(self, max_canvases=32):
+        self.max_canvases = max_canvases
+        self.free = {}  # (mode, size) -> list of images
+        self.lock = threading.Lock()
+        self.stats = {'allocated': 0, 'reused': 0}
+
+    def acquire(self, mode, size):
+        """An image of the given mode and size with undefined contents"""
+        with self.lock:
+            free = self.free.get((mode, size))
+            if free:
+                self.stats['reused'] += 1
+                return free.pop()
+            self.stats['allocated'] += 1
+        return Image.new(mode, size)
+
+    def copy(self, image):
+        """Copy of image in a pooled canvas"""
+        canvas = self.acquire(image.mode, image.size)
+        canvas.paste(image, (0, 0))  # no mask: every pixel, alpha included, is replaced
+        return canvas
+
+    def release(self, *images):
+        """Return images to the pool; they must not be used by the caller afterwards"""
+        with self.lock:
+            count = sum(len(free) for free in self.free.values())
+            for image in images:
+                if count >= self.max_canvases:
+                    break
+                free = self.free.setdefault((image.mode, image.size), [])
+                if not any(image is pooled for pooled in free):
+                    free.append(image)
+                    count += 1
@@ -0,0 +1,103 @@
+"""
+Backoff with jitter and circuit breakers for outages
+
+During a BOM FTP outage, or while Home Assistant (the SMB share) is
+rebooting, retrying at a fixed interval hammers the unavailable end and fills
+the logs. Backoff spaces retries out exponentially, with random jitter so
+several instances do not retry in lockstep.
+
+A CircuitBreaker tracks consecutive failures of one dependency. After
+`failure_threshold` of them it opens, and callers skip the dependency
+entirely until the cool-down (growing with Backoff on every consecutive trip)
+has passed. The next call is then let through as a trial: success closes the
+breaker, failure opens it again for longer.
+"""
+import logging
+import random
+import time
+
+
+class Backoff:
+    """Exponential backoff with jitter"""
+
+    def __init__(self, base, maximum, jitter=0.2):
+        """
+        Args:
+            base: Delay in seconds after the first failure
+            maximum: Upper limit on the delay before jitter
+            jitter: Fraction of the delay randomly added or removed (0-1)
+        """
+        self.base = base
+        self.maximum = max(base, maximum)
+        self.jitter = min(max(jitter, 0.0), 1.0)
+
+    def delay(self, attempt):
+        """Delay in seconds before retry number attempt (0 = first retry)"""
+        delay = min(self.base * (2 ** min(attempt, 32)), self.maximum)
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+
+class CircuitBreaker:
+    """Stops calls to a dependency while it is failing"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, name, failure_threshold=3, reset_timeout=60, reset_timeout_max=1800, jitter=0.2):
+        """
+        Args:
+            name: Dependency name for logging
+            failure_threshold: Consecutive failures that open the breaker
+            reset_timeout: Seconds the breaker first stays open
+            reset_timeout_max: Upper limit on how long the breaker stays open
+            jitter: Random fraction added to or removed from the open time
+        """
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.backoff = Backoff(reset_timeout, reset_timeout_max, jitter)
+        self.state = self.CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.opened_until = 0.0
+
+    @classmethod
+    def from_config(cls, name, config):
+        """Build a breaker from the loaded configuration dictionary"""
+        return cls(
+            name,
+            failure_threshold=config['breaker_failure_threshold'],
+            reset_timeout=config['breaker_reset_timeout'],
+            reset_timeout_max=config['breaker_reset_timeout_max'],
+            jitter=config['retry_jitter'],
+        )
+
+    def allow(self):
+        """True if the dependency should be tried now"""
+        if self.state == self.OPEN and time.monotonic() >= self.opened_until:
+            self.state = self.HALF_OPEN
+            logging.info(f"{self.name}: trying again after outage")
+        return self.state != self.OPEN
+
+    def retry_in(self):
+        """Seconds until an open breaker lets a trial call through"""
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self.opened_until - time.monotonic())
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            logging.info(f"{self.name}: recovered after {self.failures} consecutive failures")
+        self.state = self.CLOSED
+        self.failures = 0
+        self.trips = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+            timeout = self.backoff.delay(self.trips)
+            self.trips += 1
+            self.state = self.OPEN
+            self.opened_until = time.monotonic() + timeout
+            logging.warning(f"{self.name}: unavailable after {self.failures} consecutive failures - "
+                            f"not trying again for {timeout:.0f}s")
@@ -0,0 +1,200 @@
+"""
+Per-cycle profiling hooks
+
+Wraps selected processing cycles in cProfile and/or tracemalloc so slow
+cycles and memory growth can be diagnosed on the production host by changing
+configuration (or environment variables) only:
+
+- cProfile statistics are dumped to profile-<time>-cycle<n>.prof, which can
+  be opened with `python -m pstats` or snakeviz. The download, composite,
+  encode and upload stages run in pipeline threads, which cProfile does not
+  follow on its own, so each pipeline thread started during a profiled cycle
+  gets its own profiler and their statistics are merged into the dump
+- tracemalloc writes the top allocations still held at the end of the cycle,
+  compared with its start, to profile-<time>-cycle<n>.alloc.txt
+- the current resident set size of the process and its peak during the
+  cycle are logged after every cycle
+
+Only the newest `keep` files of each kind are kept.
+"""
+import cProfile
+import glob
+import logging
+import os
+import pstats
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+
+
+def rss_mb():
+    """Current and peak resident set size of this process in MB
+
+    The peak is the high-water mark since reset_peak_rss() (Linux), or over
+    the lifetime of the process where it cannot be reset.
+    """
+    current = peak = None
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    current = int(line.split()[1]) / 1024
+                elif line.startswith('VmHWM:'):
+                    peak = int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    if peak is None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # kB on Linux
+    return current, peak
+
+
+def reset_peak_rss():
+    """Restart the peak resident set size measurement
+
+    Returns:
+        bool: True if the peak was reset (Linux 4.0 and later)
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+        return True
+    except OSError:
+        return False
+
+
+class CycleProfiler:
+    """Runs processing cycles under cProfile and/or tracemalloc"""
+
+    def __init__(self, directory, cprofile=True, trace_malloc=False, every=1, keep=5, top=25,
+                 thread_prefix='pipeline-'):
+        """
+        Args:
+            directory: Where profile files are written
+            cprofile: Profile CPU time with cProfile
+            trace_malloc: Record allocations with tracemalloc
+            every: Profile every Nth cycle (1 = every cycle)
+            keep: Number of files of each kind to keep
+            top: Number of allocation sites written per cycle
+            thread_prefix: Threads started during a profiled cycle whose name
+                starts with this are profiled too. Only threads that end with
+                the cycle should match, as their profilers cannot be stopped
+                from another thread.
+        """
+        self.directory = directory
+        self.cprofile = cprofile
+        self.trace_malloc = trace_malloc
+        self.every = max(1, every)
+        self.keep = keep
+        self.top = top
+        self.thread_prefix = thread_prefix
+        self.thread_profiles = []
+        self.lock = threading.Lock()
+        self.cycle = 0
+        os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, config):
+        """Build a profiler from the loaded configuration, or None if disabled"""
+        if not config['profile_enabled']:
+            return None
+        profiler = cls(
+            config['profile_directory'] or os.path.join(config['output_directory'], 'profiles'),
+            cprofile=config['profile_cprofile'],
+            trace_malloc=config['profile_tracemalloc'],
+            every=config['profile_every'],
+            keep=config['profile_keep'],
+            top=config['profile_top'],
+        )
+        logging.info(f"Profiling enabled (cProfile={profiler.cprofile}, tracemalloc={profiler.trace_malloc}, "
+                     f"every {profiler.every} cycle(s)) - writing to {profiler.directory}")
+        return profiler
+
+    def run(self, function, *args, **kwargs):
+        """Call function, profiling it if this cycle is selected, and return its result"""
+        self.cycle += 1
+        selected = (self.cycle - 1) % self.every == 0
+        basename = os.path.join(self.directory, f"profile-{time.strftime('%Y%m%d%H%M%S')}-cycle{self.cycle}")
+
+        profile = cProfile.Profile() if selected and self.cprofile else None
+        tracing = selected and self.trace_malloc and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start(10)
+            start_snapshot = tracemalloc.take_snapshot()
+
+        peak_reset = reset_peak_rss()
+        _, peak_before = rss_mb()
+        start = time.monotonic()
+        try:
+            if profile is not None:
+                threading.setprofile(self._profile_thread)
+                try:
+                    return profile.runcall(function, *args, **kwargs)
+                finally:
+                    threading.setprofile(None)
+            return function(*args, **kwargs)
+        finally:
+            elapsed = time.monotonic() - start
+            if tracing:
+                self._write_allocations(basename + '.alloc.txt', start_snapshot)
+                self._rotate('*.alloc.txt')
+            if profile is not None:
+                self._dump_stats(profile, basename + '.prof')
+                self._rotate('*.prof')
+
+            current, peak = rss_mb()
+            current = f"{current:.1f}MB" if current is not None else 'unknown'
+            if peak_reset:
+                peak = f"peak RSS during cycle {peak:.1f}MB"
+            else:
+                peak = f"peak RSS {peak:.1f}MB (+{peak - peak_before:.1f}MB this cycle)"
+            logging.info(f"Cycle {self.cycle} took {elapsed:.2f}s, RSS {current}, {peak}"
+                         + (" (profiled)" if selected else ""))
+
+    def _profile_thread(self, frame, event, arg):
+        """threading.setprofile hook: give a new pipeline thread its own profiler"""
+        sys.setprofile(None)
+        if not threading.current_thread().name.startswith(self.thread_prefix):
+            return
+        profile = cProfile.Profile()
+        with self.lock:
+            self.thread_profiles.append(profile)
+        profile.enable()
+
+    def _dump_stats(self, profile, filepath):
+        """Write the cycle's statistics, merged across the profiled threads"""
+        with self.lock:
+            thread_profiles, self.thread_profiles = self.thread_profiles, []
+        stats = pstats.Stats(profile)
+        for thread_profile in thread_profiles:
+            try:
+                stats.add(thread_profile)
+            except TypeError:
+                pass  # the thread made no profiled calls
+        stats.dump_stats(filepath)
+        logging.debug(f"Wrote CPU profile {filepath} ({1 + len(thread_profiles)} threads)")
+
+    def _write_allocations(self, filepath, start_snapshot):
+        """Write the top allocation differences of the cycle and stop tracing"""
+        end_snapshot = tracemalloc.take_snapshot()
+        _, traced_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, cProfile.__file__)]
+        stats = end_snapshot.filter_traces(filters).compare_to(start_snapshot.filter_traces(filters), 'lineno')
+        with open(filepath, 'w') as alloc_file:
+            alloc_file.write(f"Cycle {self.cycle}: peak traced memory {traced_peak / (1024 * 1024):.1f}MB\n")
+            alloc_file.write(f"Top {self.top} allocation sites still held at the end of the cycle:\n")
+            for stat in stats[:self.top]:
+                alloc_file.write(f"{stat}\n")
+        logging.debug(f"Wrote allocation report {filepath}")
+
+    def _rotate(self, pattern):
+        """Remove all but the newest `keep` files matching pattern"""
+        files = sorted(glob.glob(os.path.join(self.directory, pattern)), key=os.path.getmtime)
+        for old in files[:-self.keep] if self.keep > 0 else []:
+            try:
+                os.remove(old)
+            except OSError as e:
+                logging.warning(f"Could not remove old profile {old}: {e}")
@@ -0,0 +1,220 @@
+"""
+Structured per-cycle trace
+
+Records a span for each step of a processing cycle (frame listing, every
+RETR, every composite, every encode and every SMB write) with its start and
+end time, attributes such as the file name, byte count and whether a cache
+was hit, and any error. At the end of the cycle the spans are written as a
+single line of OpenTelemetry OTLP/JSON (an ExportTraceServiceRequest) to a
+file or to stdout, where the OpenTelemetry Collector's otlpjsonfile receiver,
+or any log shipper that understands JSON lines, can pick them up.
+
+Every cycle is one trace. Its root span is named "cycle" and carries the
+cycle number, the result and totals of the bytes downloaded, cache hits and
+errors.
+
+Spans opened on the same thread nest; spans opened on other threads (the
+pipeline stages, encoder callbacks) are children of the cycle span.
+"""
+import contextlib
+import json
+import logging
+import os
+import secrets
+import sys
+import threading
+import time
+
+SERVICE_NAME = 'bom_radar_downloader'
+
+
+class Span:
+    """A timed operation within a cycle"""
+
+    def __init__(self, name, parent_id, attributes):
+        self.name = name
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start = time.time_ns()
+        self.end = None
+        self.error = None
+
+    def set(self, **attributes):
+        """Add or update attributes"""
+        self.attributes.update(attributes)
+
+    def fail(self, error):
+        """Mark the span as failed"""
+        self.error = str(error) or type(error).__name__
+
+    def to_otlp(self, trace_id):
+        span = {
+            'traceId': trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': 1,  # SPAN_KIND_INTERNAL
+            'startTimeUnixNano': str(self.start),
+            'endTimeUnixNano': str(self.end or time.time_ns()),
+            'attributes': [otlp_attribute(key, value) for key, value in self.attributes.items()
+                           if value is not None],
+            'status': {'code': 2, 'message': self.error} if self.error else {'code': 1},
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        return span
+
+
+def otlp_attribute(key, value):
+    """OTLP/JSON key-value pair"""
+    if isinstance(value, bool):
+        return {'key': key, 'value': {'boolValue': value}}
+    if isinstance(value, int):
+        return {'key': key, 'value': {'intValue': str(value)}}
+    if isinstance(value, float):
+        return {'key': key, 'value': {'doubleValue': value}}
+    return {'key': key, 'value': {'stringValue': str(value)}}
+
+
+class CycleTracer:
+    """Collects the spans of a cycle and writes them out when it ends"""
+
+    def __init__(self, output=None, max_bytes=10 * 1024 * 1024):
+        """
+        Args:
+            output: 'stdout', a file path to append to, or None to disable tracing
+            max_bytes: Size at which the trace file is rotated to <file>.1
+        """
+        self.output = output
+        self.max_bytes = max_bytes
+        self.cycle_number = 0
+        self.trace_id = None
+        self.root = None
+        self.spans = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    @classmethod
+    def from_config(cls, config):
+        """Build a tracer from the loaded configuration (a no-op tracer if disabled)"""
+        if not config['trace_enabled']:
+            return cls()
+        output = config['trace_output']
+        if output != 'stdout' and not os.path.isabs(output):
+            output = os.path.join(config['output_directory'], output)
+        logging.info(f"Cycle tracing enabled - writing to {output}")
+        return cls(output, max_bytes=config['trace_max_bytes'])
+
+    @property
+    def enabled(self):
+        return self.output is not None
+
+    @contextlib.contextmanager
+    def cycle(self):
+        """Trace one processing cycle; yields the root span"""
+        self.cycle_number += 1
+        if not self.enabled:
+            yield Span('cycle', None, {})
+            return
+
+        self.trace_id = secrets.token_hex(16)
+        self.spans = []
+        self.root = Span('cycle', None, {'cycle.id': self.cycle_number})
+        try:
+            yield self.root
+        except Exception as e:
+            self.root.fail(e)
+            raise
+        finally:
+            self.root.end = time.time_ns()
+            self._write()
+            self.root = None
+
+    def annotate(self, **attributes):
+        """Add attributes to the cycle span"""
+        if self.root is not None:
+            self.root.set(**attributes)
+
+    def start_span(self, name, **attributes):
+        """Open a span; it must be closed with end_span()"""
+        if self.root is None:
+            return Span(name, None, attributes)
+        stack = getattr(self.local, 'stack', None)
+        parent = stack[-1] if stack else self.root
+        span = Span(name, parent.span_id, attributes)
+        with self.lock:
+            self.spans.append(span)
+        return span
+
+    def end_span(self, span, error=None, **attributes):
+        """Close a span opened with start_span()"""
+        span.attributes.update(attributes)
+        if error is not None:
+            span.fail(error)
+        span.end = time.time_ns()
+
+    @contextlib.contextmanager
+    def span(self, name, **attributes):
+        """Trace the enclosed block; exceptions mark the span as failed and propagate"""
+        span = self.start_span(name, **attributes)
+        if self.root is None:
+            yield span
+            return
+
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = []
+        self.local.stack.append(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.fail(e)
+            raise
+        finally:
+            self.local.stack.pop()
+            span.end = time.time_ns()
+
+    def end_span_when_done(self, span, future):
+        """Close a span when future completes, recording its result as the byte count"""
+        def done(future):
+            error = future.exception()
+            self.end_span(span, error=error, bytes=None if error else future.result())
+
+        future.add_done_callback(done)
+
+    def _summarise(self):
+        """Cycle totals for the root span"""
+        retrievals = [span for span in self.spans if span.name == 'ftp.retr']
+        self.root.set(**{
+            'bytes.downloaded': sum(span.attributes.get('bytes', 0) for span in retrievals
+                                    if not span.attributes.get('cache.hit')),
+            'cache.hits': sum(1 for span in self.spans if span.attributes.get('cache.hit')),
+            'errors': sum(1 for span in self.spans if span.error),
+            'spans': len(self.spans),
+        })
+
+    def _write(self):
+        with self.lock:
+            self._summarise()
+            spans = [self.root] + self.spans
+            document = {
+                'resourceSpans': [{
+                    'resource': {'attributes': [otlp_attribute('service.name', SERVICE_NAME)]},
+                    'scopeSpans': [{
+                        'scope': {'name': SERVICE_NAME},
+                        'spans': [span.to_otlp(self.trace_id) for span in spans],
+                    }],
+                }]
+            }
+        line = json.dumps(document, separators=(',', ':')) + '\n'
+
+        try:
+            if self.output == 'stdout':
+                sys.stdout.write(line)
+                sys.stdout.flush()
+                return
+            if os.path.exists(self.output) and os.path.getsize(self.output) + len(line) > self.max_bytes:
+                os.replace(self.output, self.output + '.1')
+            with open(self.output, 'a') as trace_file:
+                trace_file.write(line)
+        except OSError as e:
+            logging.warning(f"Could not write cycle trace: {e}")
@@ -0,0 +1,160 @@
+"""
+Radar frame discovery for the BOM FTP radar directory
+
+BOM radar frames are named IDRxxx.T.YYYYMMDDHHmm.png and published at a fixed
+cadence per product (typically every 5 or 6 minutes). Listing /anon/gen/radar/
+returns thousands of names and is the most expensive metadata call made each
+cycle, so in 'predict' mode the next filenames are derived from the newest known
+timestamp and the product's cadence and probed individually with SIZE.
+
+A full listing is still used:
+- the first time a product is seen (no history to predict from)
+- every `resync_cycles` cycles, to pick up any frames prediction could miss
+- on a miss, i.e. when the next predicted frame is overdue but not on the server
+
+In 'listing' mode (the default) a single listing is taken per cycle and shared
+between the primary and overlay radars.
+"""
+import ftplib
+import logging
+from collections import Counter
+from datetime import datetime
+
+TIMESTAMP_FORMAT = '%Y%m%d%H%M'
+
+
+def frame_filename(product_id, timestamp):
+    """Build the BOM radar frame filename for a product and UTC datetime"""
+    return f"{product_id}.T.{timestamp.strftime(TIMESTAMP_FORMAT)}.png"
+
+
+def frame_time(filename):
+    """Parse the UTC datetime from a BOM radar frame filename, or None"""
+    parts = filename.split('.')
+    if len(parts) < 3:
+        return None
+    try:
+        return datetime.strptime(parts[2], TIMESTAMP_FORMAT)
+    except ValueError:
+        return None
+
+
+class FrameDiscovery:
+    """Finds the most recent frames for each radar product"""
+
+    def __init__(self, mode='listing', resync_cycles=12, max_probes=4):
+        if mode not in ('listing', 'predict'):
+            logging.warning(f"Unknown frame discovery mode '{mode}'; using listing")
+            mode = 'listing'
+        self.mode = mode
+        self.resync_cycles = resync_cycles
+        self.max_probes = max_probes
+        self.known = {}           # product_id -> sorted list of known frame filenames
+        self.cycles_since_sync = {}
+        self.listing = None
+
+    @classmethod
+    def from_config(cls, config):
+        """Build a discovery helper from the loaded configuration dictionary"""
+        return cls(
+            mode=config['ftp_discovery'],
+            resync_cycles=config['ftp_resync_cycles'],
+        )
+
+    def begin_cycle(self):
+        """Forget the previous cycle's directory listing"""
+        self.listing = None
+
+    def _list(self, ftp, product_id):
+        """Full listing of the current directory filtered to one product"""
+        if self.listing is None:
+            self.listing = ftp.nlst()
+            logging.debug(f"Listed {len(self.listing)} files in radar directory")
+
+        files = [file for file in self.listing
+                 if file.startswith(product_id + '.')
+                 and file.endswith('.png')
+                 and frame_time(file) is not None]
+        self.known[product_id] = sorted(files, key=frame_time)
+        self.cycles_since_sync[product_id] = 0
+        logging.info(f"Found {len(files)} total radar files for {product_id}")
+
+    def _cadence(self, product_id):
+        """Most common interval between the product's known frames"""
+        times = [frame_time(file) for file in self.known.get(product_id, [])]
+        gaps = [later - earlier for earlier, later in zip(times, times[1:]) if later > earlier]
+        if not gaps:
+            return None
+        return Counter(gaps).most_common(1)[0][0]
+
+    def _exists(self, ftp, filename):
+        """Probe a single filename with SIZE"""
+        try:
+            ftp.size(filename)
+            return True
+        except ftplib.error_perm:
+            return False
+
+    def _predict(self, ftp, product_id):
+        """Extend the known frames by probing predicted filenames
+
+        Returns:
+            bool: False if a full listing is needed instead
+        """
+        cadence = self._cadence(product_id)
+        if cadence is None:
+            return False
+
+        known = self.known[product_id]
+        next_time = frame_time(known[-1]) + cadence
+        found = 0
+        for _ in range(self.max_probes):
+            filename = frame_filename(product_id, next_time)
+            if not self._exists(ftp, filename):
+                break
+            known.append(filename)
+            found += 1
+            next_time += cadence
+
+        if found == self.max_probes:
+            # Possibly further behind than we can probe for; resync
+            logging.info(f"Prediction for {product_id} found {found} new frames; resyncing with a full listing")
+            return False
+
+        # A missing frame is only a miss if it should already have been published
+        overdue = datetime.utcnow() - next_time > cadence
+        if found == 0 and overdue:
+            logging.info(f"Predicted frame {frame_filename(product_id, next_time)} is overdue; "
+                         f"falling back to a full listing")
+            return False
+
+        self.cycles_since_sync[product_id] += 1
+        logging.info(f"Predicted {found} new frame(s) for {product_id} without listing "
+                     f"(cadence {int(cadence.total_seconds() // 60)} min)")
+        return True
+
+    def recent_frames(self, ftp, product_id, count=5):
+        """Return the filenames of the most recent frames for a product, oldest first
+
+        Args:
+            ftp: FTPTransport positioned in the radar directory
+            product_id: BOM product ID, e.g. IDR022
+            count: Number of frames wanted
+
+        Returns:
+            list: Up to `count` filenames sorted by timestamp
+        """
+        use_prediction = (
+            self.mode == 'predict'
+            and self.known.get(product_id)
+            and self.cycles_since_sync.get(product_id, 0) < self.resync_cycles
+        )
+
+        if not (use_prediction and self._predict(ftp, product_id)):
+            self._list(ftp, product_id)
+
+        # Only the most recent frames are ever needed again for prediction
+        self.known[product_id] = self.known[product_id][-max(count, 2):]
+        files = self.known[product_id][-count:]
+        logging.info(f"Selected most recent {len(files)}: {[f.split('.')[2] for f in files]}")
+        return files
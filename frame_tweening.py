@@ -0,0 +1,77 @@
+"""
+Crossfade frames between radar frames
+
+A five-frame loop at 500ms per frame looks jerky on a large display. The
+tweener inserts `steps` crossfaded frames between each pair of consecutive
+radar frames, so rain appears to move smoothly from one frame to the next.
+
+Crossfades are cached per frame pair. The pairs already in the loop are
+unchanged from the previous cycle, so a cycle with one new radar frame blends
+only the one new pair, however long the loop is.
+"""
+import logging
+
+from PIL import Image
+
+
+class FrameTweener:
+    """Inserts cached crossfades between consecutive frames"""
+
+    def __init__(self, steps):
+        """
+        Args:
+            steps: Crossfade frames inserted between two radar frames
+        """
+        self.steps = steps
+        self.cache = {}  # (frame key, next frame key) -> crossfade images
+        self.stats = {'blended': 0, 'reused': 0}
+
+    @classmethod
+    def from_config(cls, config):
+        """Build a tweener from the loaded configuration, or None if tweening is off"""
+        if config['gif_tween_frames'] <= 0:
+            return None
+        logging.info(f"GIF tweening enabled: {config['gif_tween_frames']} crossfade frames between radar frames")
+        return cls(config['gif_tween_frames'])
+
+    def clear(self):
+        """Forget every cached crossfade, e.g. after the frames they came from were redrawn"""
+        self.cache = {}
+
+    def interpolate(self, frames, keys):
+        """Frames with crossfades inserted between each consecutive pair
+
+        Args:
+            frames: Images of the same mode and size, oldest first
+            keys: Cache key identifying the content of each frame, or None
+                for frames that may differ next cycle (nothing is cached for them)
+
+        Returns:
+            list: frames[0], its crossfades, frames[1], ... frames[-1]
+        """
+        cache = {}
+        blended = 0
+        output = []
+        for i, frame in enumerate(frames):
+            output.append(frame)
+            if i + 1 == len(frames):
+                break
+
+            pair = (keys[i], keys[i + 1])
+            cacheable = None not in pair
+            tweens = self.cache.get(pair) if cacheable else None
+            if tweens is None:
+                following = frames[i + 1]
+                tweens = [Image.blend(frame, following, step / (self.steps + 1))
+                          for step in range(1, self.steps + 1)]
+                blended += 1
+            if cacheable:
+                cache[pair] = tweens
+            output.extend(tweens)
+
+        # Only pairs still in the loop are kept
+        self.cache = cache
+        self.stats['blended'] += blended
+        self.stats['reused'] += max(0, len(frames) - 1 - blended)
+        logging.debug(f"Tweening: blended {blended} frame pairs, reused {max(0, len(frames) - 1 - blended)}")
+        return output
@@ -0,0 +1,285 @@
+"""
+Record and replay of FTP sessions
+
+In record mode every listing, SIZE probe and downloaded file of a cycle is
+captured to a directory:
+
+    <directory>/cycles/000001.json   operations of the first cycle, in order
+    <directory>/blobs/<sha256>       downloaded file contents (stored once)
+
+In replay mode FTPReplay.connect stands in for ftplib.FTP and serves those
+recordings, cycle by cycle, with a configurable per-command latency and
+download bandwidth. BOM's data changes every few minutes, so replaying a
+recorded session makes cycles deterministic and lets them be profiled
+offline and without network access.
+
+Both plug into FTPTransport as its connection factory, so the retry, resume
+and frame discovery logic runs unchanged on top of them.
+"""
+import ftplib
+import glob
+import hashlib
+import json
+import logging
+import os
+import posixpath
+import time
+from datetime import datetime
+
+
+def _resolve(directory, path):
+    """Absolute remote path of path relative to directory"""
+    return posixpath.normpath(posixpath.join(directory or '/', path))
+
+
+def session_from_config(config):
+    """FTPRecorder or FTPReplay for the configured session mode, or None for live sessions"""
+    mode = config['ftp_session_mode']
+    directory = config['ftp_session_directory']
+    if mode == 'record':
+        logging.info(f"Recording FTP sessions to {directory}")
+        return FTPRecorder(directory)
+    if mode == 'replay':
+        return FTPReplay(directory, latency=config['ftp_replay_latency_ms'] / 1000,
+                         bandwidth=config['ftp_replay_bandwidth_kbps'] * 1000 // 8)
+    if mode != 'live':
+        logging.warning(f"Unknown FTP session mode '{mode}'; using live")
+    return None
+
+
+class FTPRecorder:
+    """Captures the FTP operations of each cycle to a directory"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.cycle_directory = os.path.join(directory, 'cycles')
+        self.blob_directory = os.path.join(directory, 'blobs')
+        os.makedirs(self.cycle_directory, exist_ok=True)
+        os.makedirs(self.blob_directory, exist_ok=True)
+        self.cycle = len(glob.glob(os.path.join(self.cycle_directory, '*.json')))
+        self.events = None
+        self.partial = {}  # remote path -> bytes received by interrupted downloads
+
+    def begin_cycle(self):
+        self.cycle += 1
+        self.events = []
+        self.partial = {}
+
+    def end_cycle(self):
+        """Write the operations of the cycle"""
+        if not self.events:
+            self.events = None
+            self.cycle -= 1
+            return
+        path = os.path.join(self.cycle_directory, f"{self.cycle:06d}.json")
+        with open(path + '.tmp', 'w') as cycle_file:
+            json.dump({'recorded': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+                       'events': self.events}, cycle_file, indent=1)
+        os.replace(path + '.tmp', path)
+        logging.info(f"Recorded {len(self.events)} FTP operations to {path}")
+        self.events = None
+
+    def record(self, event):
+        if self.events is not None:
+            self.events.append(event)
+
+    def store(self, data):
+        """Save file contents and return their digest"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = os.path.join(self.blob_directory, digest)
+        if not os.path.exists(path):
+            with open(path + '.tmp', 'wb') as blob:
+                blob.write(data)
+            os.replace(path + '.tmp', path)
+        return digest
+
+    def connect(self, host, timeout=None):
+        """ftplib.FTP factory that records the session"""
+        return RecordingFTP(ftplib.FTP(host, timeout=timeout), self)
+
+
+class RecordingFTP:
+    """ftplib.FTP wrapper that passes every call through and records the results"""
+
+    def __init__(self, ftp, recorder):
+        self.ftp = ftp
+        self.recorder = recorder
+        self.directory = '/'
+
+    def __getattr__(self, name):
+        return getattr(self.ftp, name)
+
+    def cwd(self, directory):
+        response = self.ftp.cwd(directory)
+        self.directory = _resolve(self.directory, directory)
+        return response
+
+    def nlst(self, *args):
+        names = self.ftp.nlst(*args)
+        self.recorder.record({'op': 'nlst', 'path': self.directory, 'names': names})
+        return names
+
+    def size(self, filename):
+        event = {'op': 'size', 'path': _resolve(self.directory, filename)}
+        try:
+            event['size'] = self.ftp.size(filename)
+            return event['size']
+        except ftplib.error_perm as e:
+            event['error'] = str(e)
+            raise
+        finally:
+            self.recorder.record(event)
+
+    def retrbinary(self, cmd, callback, blocksize=8192, rest=None):
+        filename = cmd.split(' ', 1)[1]
+        path = _resolve(self.directory, filename)
+
+        # A resumed transfer continues the bytes buffered by the interrupted attempts
+        received = self.recorder.partial.pop(path, b'')
+        if rest and len(received) < rest:
+            logging.warning(f"Recording is missing the first {rest} bytes of {path}; it will not be replayed")
+            received = None
+        elif received is not None:
+            received = received[:rest or 0]
+        chunks = []
+
+        def capture(chunk):
+            chunks.append(chunk)
+            callback(chunk)
+
+        event = {'op': 'retr', 'path': path}
+        try:
+            response = self.ftp.retrbinary(cmd, capture, blocksize, rest)
+        except ftplib.error_perm as e:
+            event['error'] = str(e)
+            self.recorder.record(event)
+            raise
+        except BaseException:
+            if received is not None:
+                self.recorder.partial[path] = received + b''.join(chunks)
+            raise
+        if received is not None:
+            data = received + b''.join(chunks)
+            event.update(sha256=self.recorder.store(data), bytes=len(data))
+            self.recorder.record(event)
+        return response
+
+
+class FTPReplay:
+    """Serves recorded cycles through ReplayFTP connections"""
+
+    def __init__(self, directory, latency=0.0, bandwidth=0):
+        """
+        Args:
+            directory: Directory written by FTPRecorder
+            latency: Seconds added to every FTP command
+            bandwidth: Download speed in bytes per second (0 = unlimited)
+        """
+        self.directory = directory
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.cycle_files = sorted(glob.glob(os.path.join(directory, 'cycles', '*.json')))
+        if not self.cycle_files:
+            raise FileNotFoundError(f"No recorded FTP cycles in {directory}")
+        self.cycle = 0
+
+        # Files can be downloaded in any cycle after they were first recorded,
+        # since the processor keeps frames in memory between cycles
+        self.blobs = {}
+        self.listings = {}
+        self.sizes = {}
+        logging.info(f"Replaying {len(self.cycle_files)} recorded FTP cycles from {directory}")
+
+    def begin_cycle(self):
+        """Switch to the next recorded cycle (the last one repeats)"""
+        if self.cycle >= len(self.cycle_files):
+            logging.warning("No more recorded FTP cycles; replaying the last one again")
+            return
+        with open(self.cycle_files[self.cycle]) as cycle_file:
+            events = json.load(cycle_file)['events']
+        self.cycle += 1
+
+        self.listings, self.sizes = {}, {}
+        for event in events:
+            if event['op'] == 'nlst':
+                self.listings[event['path']] = event['names']
+            elif event['op'] == 'size':
+                self.sizes[event['path']] = event.get('size', event.get('error'))
+            elif event['op'] == 'retr' and 'sha256' in event:
+                self.blobs[event['path']] = event['sha256']
+                self.sizes.setdefault(event['path'], event['bytes'])
+        logging.info(f"Replaying recorded FTP cycle {self.cycle} of {len(self.cycle_files)}")
+
+    def end_cycle(self):
+        pass
+
+    def read(self, path):
+        """Recorded contents of a remote file, or None"""
+        digest = self.blobs.get(path)
+        if digest is None:
+            return None
+        with open(os.path.join(self.directory, 'blobs', digest), 'rb') as blob:
+            return blob.read()
+
+    def connect(self, host, timeout=None):
+        """ftplib.FTP factory serving the recordings"""
+        return ReplayFTP(self)
+
+
+class ReplayFTP:
+    """Local stand-in for ftplib.FTP backed by an FTPReplay"""
+
+    def __init__(self, replay):
+        self.replay = replay
+        self.directory = '/'
+
+    def _command(self):
+        if self.replay.latency:
+            time.sleep(self.replay.latency)
+
+    def login(self, *args, **kwargs):
+        self._command()
+        return '230 Login successful.'
+
+    def voidcmd(self, cmd):
+        self._command()
+        return '200 OK'
+
+    def cwd(self, directory):
+        self._command()
+        self.directory = _resolve(self.directory, directory)
+        return '250 Directory successfully changed.'
+
+    def nlst(self, *args):
+        self._command()
+        names = self.replay.listings.get(self.directory)
+        if names is None:
+            raise ftplib.error_temp(f"450 No recorded listing of {self.directory}")
+        return list(names)
+
+    def size(self, filename):
+        self._command()
+        size = self.replay.sizes.get(_resolve(self.directory, filename))
+        if not isinstance(size, int):
+            raise ftplib.error_perm(size or f"550 {filename}: No such file.")
+        return size
+
+    def retrbinary(self, cmd, callback, blocksize=8192, rest=None):
+        self._command()
+        filename = cmd.split(' ', 1)[1]
+        data = self.replay.read(_resolve(self.directory, filename))
+        if data is None:
+            raise ftplib.error_perm(f"550 Failed to open file {filename}.")
+
+        for start in range(rest or 0, len(data), blocksize):
+            block = data[start:start + blocksize]
+            if self.replay.bandwidth:
+                time.sleep(len(block) / self.replay.bandwidth)
+            callback(block)
+        return '226 Transfer complete.'
+
+    def quit(self):
+        return '221 Goodbye.'
+
+    def close(self):
+        pass
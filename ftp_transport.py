@@ -0,0 +1,176 @@
+"""
+Resilient FTP transport for the BOM anonymous FTP server
+
+Wraps ftplib.FTP so that every operation (cwd, nlst, RETR) is retried with
+exponential backoff. Connection-level failures (timeouts, dropped control
+connections, 421 responses) transparently reconnect, log in again and restore
+the working directory before the operation is retried. Interrupted downloads
+are resumed with a REST offset, so a transient failure costs one file rather
+than the whole processing cycle.
+"""
+import ftplib
+import logging
+import time
+
+FTP_HOST = 'ftp.bom.gov.au'
+
+
+class FTPTransport:
+    """Retrying, reconnecting wrapper around a single FTP control connection"""
+
+    def __init__(self, host=FTP_HOST, timeout=30, max_retries=3, backoff=2.0, backoff_max=30.0, factory=ftplib.FTP):
+        """
+        Args:
+            factory: Callable (host, timeout=...) returning an ftplib.FTP compatible
+                connection, e.g. a recording or replaying stand-in
+        """
+        self.host = host
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.factory = factory
+        self.ftp = None
+        self.directory = None
+
+    @classmethod
+    def from_config(cls, config, factory=ftplib.FTP):
+        """Build a transport from the loaded configuration dictionary"""
+        return cls(
+            timeout=config['ftp_timeout'],
+            max_retries=config['ftp_max_retries'],
+            backoff=config['ftp_retry_backoff'],
+            backoff_max=config['ftp_retry_backoff_max'],
+            factory=factory,
+        )
+
+    def connect(self):
+        """Open the control connection, log in and restore the working directory"""
+        logging.info(f"Connecting to FTP server {self.host}...")
+        ftp = self.factory(self.host, timeout=self.timeout)
+        try:
+            ftp.login()
+            # Binary mode for the whole session so SIZE probes are reliable
+            ftp.voidcmd('TYPE I')
+            if self.directory:
+                ftp.cwd(self.directory)
+        except BaseException:
+            ftp.close()
+            raise
+        self.ftp = ftp
+
+    def close(self):
+        """Politely end the session, falling back to dropping the socket"""
+        if self.ftp is None:
+            return
+        try:
+            self.ftp.quit()
+        except ftplib.all_errors:
+            self.ftp.close()
+        finally:
+            self.ftp = None
+        logging.info("Disconnected from FTP server")
+
+    def is_alive(self):
+        """Health check the control connection with a NOOP
+
+        A connection that fails the check is discarded so the next operation
+        transparently builds a fresh session.
+
+        Returns:
+            bool: True if the existing connection answered the NOOP
+        """
+        if self.ftp is None:
+            return False
+        try:
+            self.ftp.voidcmd('NOOP')
+            return True
+        except ftplib.all_errors as e:
+            logging.info(f"FTP session is no longer usable ({e}); it will be rebuilt on next use")
+            self._drop()
+            return False
+
+    def keepalive(self):
+        """Send a NOOP so an idle persistent session is not timed out by the server"""
+        if self.ftp is not None and self.is_alive():
+            logging.debug("Sent FTP keepalive NOOP")
+
+    def _drop(self):
+        """Discard a connection that is in an unknown state"""
+        if self.ftp is not None:
+            try:
+                self.ftp.close()
+            except ftplib.all_errors:
+                pass
+            self.ftp = None
+
+    def _delay(self, attempt):
+        """Exponential backoff delay in seconds for the given retry attempt"""
+        return min(self.backoff * (2 ** attempt), self.backoff_max)
+
+    def _call(self, description, operation):
+        """Run operation(ftp) with retries, reconnecting between attempts
+
+        Permanent (5xx) replies are raised immediately since retrying them
+        cannot succeed. Anything else is treated as transient.
+
+        Args:
+            description: Human readable name of the operation for logging
+            operation: Callable taking the live ftplib.FTP instance
+
+        Returns:
+            Whatever operation returns
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                if self.ftp is None:
+                    self.connect()
+                return operation(self.ftp)
+            except ftplib.error_perm:
+                raise
+            except ftplib.all_errors as e:
+                self._drop()
+                if attempt >= self.max_retries:
+                    logging.error(f"FTP {description} failed after {attempt + 1} attempts: {e}")
+                    raise
+                delay = self._delay(attempt)
+                logging.warning(f"FTP {description} failed ({e}); reconnecting and retrying in {delay:.1f}s "
+                                f"(attempt {attempt + 1}/{self.max_retries})")
+                time.sleep(delay)
+
+    def cwd(self, directory):
+        """Change directory and remember it so reconnects land in the same place"""
+        self._call(f"CWD {directory}", lambda ftp: ftp.cwd(directory))
+        self.directory = directory
+
+    def nlst(self):
+        """List the current directory"""
+        return self._call("NLST", lambda ftp: ftp.nlst())
+
+    def size(self, filename):
+        """Size of a remote file in bytes; raises ftplib.error_perm if it does not exist"""
+        return self._call(f"SIZE {filename}", lambda ftp: ftp.size(filename))
+
+    def retrieve(self, filename):
+        """Download a file into memory, resuming from the last received byte on retry
+
+        Returns:
+            bytes: The complete file contents
+        """
+        buffer = bytearray()
+
+        def retr(ftp):
+            offset = len(buffer)
+            if offset:
+                logging.debug(f"Resuming {filename} from byte {offset}")
+                try:
+                    ftp.retrbinary('RETR ' + filename, buffer.extend, rest=offset)
+                    return
+                except ftplib.error_perm as e:
+                    # Server refused REST; start the file again from scratch
+                    logging.debug(f"Resume of {filename} refused ({e}); restarting download")
+                    del buffer[:]
+            ftp.retrbinary('RETR ' + filename, buffer.extend)
+
+        self._call(f"RETR {filename}", retr)
+        return bytes(buffer)
@@ -0,0 +1,161 @@
+"""
+Process pool image encoding
+
+PNG and GIF encoding is CPU bound and single threaded inside Pillow, so images
+are handed to a pool of worker processes and written to the output directory
+in parallel. The pool is created on first use and reused across cycles.
+
+With a single worker everything is encoded inline in the calling process.
+"""
+import concurrent.futures
+import logging
+import multiprocessing
+import os
+from concurrent.futures.process import BrokenProcessPool
+
+# zlib strategies accepted by Pillow's PNG encoder as compress_type
+PNG_STRATEGIES = {
+    'default': 0,
+    'filtered': 1,
+    'huffman': 2,
+    'rle': 3,
+    'fixed': 4,
+}
+
+
+def _save_image(image, filepath, params):
+    """Worker: encode a single image to disk"""
+    image.save(filepath, **params)
+    return os.path.getsize(filepath)
+
+
+def _save_animation(frames, filepath, params):
+    """Worker: encode an animation to disk"""
+    frames[0].save(filepath, save_all=True, append_images=frames[1:], **params)
+    return os.path.getsize(filepath)
+
+
+class ImageEncoder:
+    """Encodes images to files, in parallel when more than one worker is configured"""
+
+    def __init__(self, workers=1, png_compression=6, png_strategy='default', optimize=False, tracer=None):
+        self.workers = workers if workers > 0 else (os.cpu_count() or 1)
+        self.png_compression = png_compression
+        if png_strategy not in PNG_STRATEGIES:
+            logging.warning(f"Unknown PNG compression strategy '{png_strategy}'; using default")
+            png_strategy = 'default'
+        self.png_strategy = png_strategy
+        self.optimize = optimize
+        self.tracer = tracer
+        self.pool = None
+        self.pending = []
+
+    @classmethod
+    def from_config(cls, config, tracer=None):
+        """Build an encoder from the loaded configuration dictionary"""
+        return cls(
+            workers=config['encode_workers'],
+            png_compression=config['png_compression'],
+            png_strategy=config['png_strategy'],
+            optimize=config['optimize_size'],
+            tracer=tracer,
+        )
+
+    def png_params(self):
+        """Image.save keyword arguments for PNG output"""
+        return {
+            'format': 'PNG',
+            'compress_level': self.png_compression,
+            'compress_type': PNG_STRATEGIES[self.png_strategy],
+            'optimize': self.optimize,
+        }
+
+    def gif_params(self):
+        """Image.save keyword arguments for GIF output"""
+        return {
+            'format': 'GIF',
+            'optimize': self.optimize,
+        }
+
+    def submit(self, function, *args):
+        """Run function(*args) in the pool (or inline) and return a Future"""
+        if self.workers <= 1:
+            future = concurrent.futures.Future()
+            try:
+                future.set_result(function(*args))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        if self.pool is None:
+            self.pool = self._start_pool()
+        try:
+            return self.pool.submit(function, *args)
+        except BrokenProcessPool:
+            # A worker died in an earlier cycle; start a fresh pool
+            self.pool = self._start_pool()
+            return self.pool.submit(function, *args)
+
+    def _start_pool(self):
+        # The pool may be started from a pipeline thread, so avoid forking a
+        # multi-threaded process where the platform offers an alternative
+        method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        logging.debug(f"Starting image encoder pool with {self.workers} workers ({method})")
+        return concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context(method),
+        )
+
+    def _submit_traced(self, filepath, function, *args):
+        """submit(), recorded as an encode span when tracing"""
+        if self.tracer is None:
+            return self.submit(function, *args)
+        span = self.tracer.start_span('encode', file=os.path.basename(filepath))
+        future = self.submit(function, *args)
+        self.tracer.end_span_when_done(span, future)
+        return future
+
+    def encode(self, image, filepath, **params):
+        """Write a single image to filepath, returning a Future for the file size"""
+        return self._submit_traced(filepath, _save_image, image, filepath, params)
+
+    def save(self, filename, image, filepath, **params):
+        """Queue a single image to be written to filepath
+
+        Args:
+            filename: Name reported back by wait() once written
+            image: PIL Image
+            filepath: Destination path
+            params: Keyword arguments for Image.save (format, optimize, ...)
+        """
+        self.pending.append((filename, self.encode(image, filepath, **params)))
+
+    def save_animation(self, filename, frames, filepath, **params):
+        """Queue an animation (e.g. a GIF) to be written to filepath"""
+        self.pending.append((filename, self._submit_traced(filepath, _save_animation, frames, filepath, params)))
+
+    def wait(self):
+        """Wait for every queued image
+
+        Returns:
+            list: Filenames that were written successfully, in submission order
+        """
+        written = []
+        for filename, future in self.pending:
+            try:
+                size = future.result()
+                logging.debug(f"Encoded {filename} ({size} bytes)")
+                written.append(filename)
+            except BrokenProcessPool as e:
+                logging.error(f"Image encoder pool failed while writing {filename}: {e}")
+                self.shutdown()
+            except Exception as e:
+                logging.error(f"Failed to encode {filename}: {e}")
+        self.pending = []
+        return written
+
+    def shutdown(self):
+        """Stop the worker processes"""
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
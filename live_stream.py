@@ -0,0 +1,175 @@
+"""
+Rolling HLS live stream of the radar loop
+
+Instead of re-encoding and re-uploading the whole loop every cycle, each new
+radar frame is encoded once into a short H.264 MPEG-TS segment by an ffmpeg
+subprocess and appended to an HLS playlist. The oldest segment is evicted when
+the playlist exceeds its window. A cycle with one new frame therefore writes
+one segment and the playlist, however long the loop is.
+
+Segments carry continuous timestamps (each starts where the previous one
+ended), so players see one uninterrupted stream.
+
+ffmpeg is optional: it is looked up on the PATH (or at the configured path)
+and the stream is disabled with a warning if it cannot be found.
+"""
+import logging
+import os
+import shutil
+import subprocess
+from collections import deque
+
+
+class LiveStream:
+    """Maintains an HLS playlist with one segment per radar frame"""
+
+    def __init__(self, directory, playlist='radar_stream.m3u8', segment_seconds=1.0, window=10,
+                 ffmpeg='ffmpeg', crf=28):
+        """
+        Args:
+            directory: Output directory for the playlist and segments
+            playlist: Playlist filename; segments are named after it
+            segment_seconds: How long each frame is shown
+            window: Number of segments (frames) kept in the playlist
+            ffmpeg: ffmpeg executable
+            crf: x264 quality (lower is better and larger)
+        """
+        self.directory = directory
+        self.playlist = playlist
+        self.segment_prefix = os.path.splitext(playlist)[0]
+        self.segment_seconds = segment_seconds
+        self.window = max(1, window)
+        self.ffmpeg = ffmpeg
+        self.crf = crf
+        self.segments = deque()  # (frame timestamp, segment filename)
+        self.sequence = 0        # media sequence number of the oldest segment
+        self.position = 0.0      # stream time at the end of the newest segment
+
+    @classmethod
+    def from_config(cls, config):
+        """Build a live stream from the loaded configuration, or None if disabled or ffmpeg is missing"""
+        if not config['stream_enabled']:
+            return None
+        ffmpeg = shutil.which(config['stream_ffmpeg'])
+        if ffmpeg is None:
+            logging.warning(f"Live stream enabled but ffmpeg ('{config['stream_ffmpeg']}') was not found - "
+                            f"stream disabled")
+            return None
+        logging.info(f"Live stream enabled: {config['stream_playlist']} using {ffmpeg}")
+        return cls(
+            config['output_directory'],
+            playlist=config['stream_playlist'],
+            segment_seconds=config['stream_segment_seconds'],
+            window=config['stream_window'],
+            ffmpeg=ffmpeg,
+            crf=config['stream_crf'],
+        )
+
+    def snapshot(self):
+        """Playlist state for warm restarts"""
+        return {'segments': list(self.segments), 'sequence': self.sequence, 'position': self.position}
+
+    def restore(self, state):
+        """Continue the playlist saved by snapshot(), keeping only segments still on disk"""
+        segments = [(timestamp, filename) for timestamp, filename in state['segments']
+                    if os.path.exists(os.path.join(self.directory, filename))]
+        self.sequence = state['sequence'] + len(state['segments']) - len(segments)
+        self.segments = deque(segments)
+        self.position = state['position']
+
+    def discard(self):
+        """Delete every segment and the playlist from the output directory
+
+        Returns:
+            list: Segment filenames that were in the playlist
+        """
+        filenames = [filename for _, filename in self.segments]
+        for filename in filenames + [self.playlist]:
+            try:
+                os.remove(os.path.join(self.directory, filename))
+            except OSError:
+                pass
+        self.segments.clear()
+        return filenames
+
+    def update(self, frames):
+        """Append segments for frames that are not in the stream yet
+
+        Args:
+            frames: List of (timestamp, image) for the current loop, oldest first
+
+        Returns:
+            tuple: (filenames written, segment filenames evicted from the playlist)
+        """
+        newest = self.segments[-1][0] if self.segments else None
+        written = []
+        for timestamp, image in frames:
+            if newest is not None and timestamp <= newest:
+                continue
+            filename = f"{self.segment_prefix}_{timestamp}.ts"
+            if not self._encode(image, filename):
+                break
+            self.segments.append((timestamp, filename))
+            self.position += self.segment_seconds
+            newest = timestamp
+            written.append(filename)
+
+        if not written:
+            return [], []
+
+        evicted = []
+        while len(self.segments) > self.window:
+            _, filename = self.segments.popleft()
+            self.sequence += 1
+            evicted.append(filename)
+            try:
+                os.remove(os.path.join(self.directory, filename))
+            except OSError:
+                pass
+
+        self._write_playlist()
+        logging.info(f"Live stream: added {len(written)} segment(s), {len(self.segments)} in playlist")
+        return written + [self.playlist], evicted
+
+    def _encode(self, image, filename):
+        """Encode one frame, held for segment_seconds, as an MPEG-TS segment"""
+        width, height = image.size
+        path = os.path.join(self.directory, filename)
+        command = [
+            self.ffmpeg, '-hide_banner', '-loglevel', 'error', '-y',
+            '-f', 'rawvideo', '-pix_fmt', 'rgba', '-s', f'{width}x{height}', '-r', '1', '-i', '-',
+            '-vf', (f'tpad=stop_mode=clone:stop_duration={self.segment_seconds},'
+                    f'pad=ceil(iw/2)*2:ceil(ih/2)*2,format=yuv420p'),
+            '-r', '10', '-t', str(self.segment_seconds),
+            '-c:v', 'libx264', '-preset', 'veryfast', '-tune', 'stillimage', '-crf', str(self.crf),
+            '-output_ts_offset', f'{self.position:.3f}',
+            '-f', 'mpegts', path + '.tmp',
+        ]
+        try:
+            subprocess.run(command, input=image.convert('RGBA').tobytes(), check=True,
+                           capture_output=True, timeout=60)
+        except (OSError, subprocess.SubprocessError) as e:
+            stderr = getattr(e, 'stderr', None)
+            detail = stderr.decode(errors='replace').strip() if stderr else e
+            logging.error(f"Live stream: ffmpeg failed to encode {filename}: {detail}")
+            return False
+        os.replace(path + '.tmp', path)
+        return True
+
+    def _write_playlist(self):
+        """Atomically rewrite the playlist for the current window"""
+        target = max(1, int(-(-self.segment_seconds // 1)))  # whole seconds, rounded up
+        lines = [
+            '#EXTM3U',
+            '#EXT-X-VERSION:3',
+            f'#EXT-X-TARGETDURATION:{target}',
+            f'#EXT-X-MEDIA-SEQUENCE:{self.sequence}',
+        ]
+        for _, filename in self.segments:
+            lines.append(f'#EXTINF:{self.segment_seconds:.3f},')
+            lines.append(filename)
+
+        path = os.path.join(self.directory, self.playlist)
+        with open(path + '.tmp', 'w') as playlist:
+            playlist.write('\n'.join(lines) + '\n')
+        os.replace(path + '.tmp', path)
@@ -0,0 +1,86 @@
+"""
+Streaming stage pipeline
+
+Runs a sequence of stages (for example download -> composite -> encode ->
+upload) in their own threads, connected by bounded queues. While one item is
+being downloaded the previous one is being composited and the one before
+that encoded or uploaded, so the wall time of a cycle approaches that of the
+slowest stage rather than the sum of all stages. Network transfers, zlib
+compression and most Pillow image operations release the GIL, so the stages
+genuinely overlap.
+
+Each stage runs in a single thread, so items leave the pipeline in the order
+they entered it.
+"""
+import logging
+import queue
+import threading
+
+_DONE = object()
+
+
+class Pipeline:
+    """A chain of single-threaded stages connected by bounded queues"""
+
+    def __init__(self, stages, queue_size=2):
+        """
+        Args:
+            stages: List of (name, function) pairs. Each function takes the
+                previous stage's output and returns its own output, or None
+                to drop the item (e.g. a failed download).
+            queue_size: Maximum items waiting between two stages
+        """
+        self.stages = stages
+        self.queue_size = max(1, queue_size)
+
+    def _worker(self, name, function, inbox, outbox, results):
+        while True:
+            item = inbox.get()
+            if item is _DONE:
+                if outbox is not None:
+                    outbox.put(_DONE)
+                return
+
+            try:
+                output = function(item)
+            except Exception as e:
+                logging.error(f"Pipeline {name} stage failed: {e}")
+                output = None
+
+            if output is None:
+                continue
+            if outbox is not None:
+                outbox.put(output)
+            else:
+                results.append(output)
+
+    def run(self, items):
+        """Feed items through every stage and wait for the pipeline to drain
+
+        Returns:
+            list: Outputs of the final stage, in input order
+        """
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        results = []
+
+        threads = []
+        for index, (name, function) in enumerate(self.stages):
+            outbox = queues[index + 1] if index + 1 < len(queues) else None
+            thread = threading.Thread(
+                target=self._worker,
+                args=(name, function, queues[index], outbox, results),
+                name=f"pipeline-{name}",
+                daemon=True,
+            )
+            thread.start()
+            threads.append(thread)
+
+        try:
+            for item in items:
+                queues[0].put(item)
+        finally:
+            queues[0].put(_DONE)
+            for thread in threads:
+                thread.join()
+
+        return results
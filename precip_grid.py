@@ -0,0 +1,134 @@
+"""
+Decoded precipitation grid export
+
+Converts each raw primary radar frame of the loop from BOM palette colours to
+intensity levels (0 = no rain, 1-15 = BOM rain rate levels, see
+radar_palette) and writes the whole loop as a single uint8 array stack of
+shape (frames, height, width) in NumPy's .npy format, alongside a JSON file
+describing it.
+
+The .npy file is a fixed-size header followed by the raw array bytes, so
+consumers can memory-map it without decoding any image, e.g.
+    numpy.load('radar_grid.npy', mmap_mode='r')
+or read the bytes directly starting at `data_offset` from the JSON file.
+NumPy is not needed to write it.
+
+Raw BOM frames are palette images, so the colour to level conversion is a
+256 entry lookup table applied to the palette indices with bytes.translate.
+"""
+import io
+import json
+import logging
+import os
+import struct
+
+from PIL import Image
+
+from radar_palette import BOM_RAIN_PALETTE, RAIN_RATES, rain_level
+
+NPY_MAGIC = b'\x93NUMPY\x01\x00'
+
+
+def frame_levels(data):
+    """Decode a raw BOM radar PNG into a grid of intensity levels
+
+    Args:
+        data: Raw PNG bytes as downloaded from BOM
+
+    Returns:
+        tuple: ((width, height), bytes with one level per pixel, row-major)
+    """
+    image = Image.open(io.BytesIO(data))
+
+    if image.mode == 'P':
+        palette = image.getpalette() or []
+        lut = bytearray(256)
+        for index in range(min(256, len(palette) // 3)):
+            rgb = tuple(palette[index * 3:index * 3 + 3])
+            lut[index] = BOM_RAIN_PALETTE.get(rgb, (0, 0))[0]
+        transparency = image.info.get('transparency')
+        if isinstance(transparency, int):
+            lut[transparency] = 0
+        return image.size, image.tobytes().translate(bytes(lut))
+
+    # Not a palette image; fall back to a per-pixel lookup
+    image = image.convert('RGBA')
+    return image.size, bytes(rain_level(pixel) for pixel in image.getdata())
+
+
+def npy_header(shape):
+    """NumPy .npy version 1.0 header for a C-ordered uint8 array of the given shape"""
+    header = repr({'descr': '|u1', 'fortran_order': False, 'shape': tuple(shape)})
+    # Pad so the array data starts on a 64 byte boundary
+    padding = 64 - (len(NPY_MAGIC) + 2 + len(header) + 1) % 64
+    header = (header + ' ' * padding + '\n').encode('latin1')
+    return NPY_MAGIC + struct.pack('<H', len(header)) + header
+
+
+class PrecipitationGrid:
+    """Writes the loop's decoded intensity levels as a memory-mappable array"""
+
+    def __init__(self, basename='radar_grid'):
+        self.basename = basename
+        self.levels = {}  # frame filename -> ((width, height), level bytes)
+
+    def write(self, directory, files, raw_frames, metadata):
+        """Write <basename>.npy and <basename>.json for the loop
+
+        Args:
+            directory: Output directory
+            files: Primary frame filenames of the loop, oldest first
+            raw_frames: Mapping of filename to raw PNG bytes
+            metadata: Extra fields for the JSON description (product, scale, ...)
+
+        Returns:
+            list: Filenames written
+        """
+        # Decode only frames that are new to the loop
+        self.levels = {file: grid for file, grid in self.levels.items() if file in files}
+        grids = []
+        for file in files:
+            if file not in self.levels:
+                data = raw_frames.get(file)
+                if data is None:
+                    continue
+                self.levels[file] = frame_levels(data)
+            grids.append((file, self.levels[file]))
+
+        if not grids:
+            logging.warning("No frames available for the precipitation grid")
+            return []
+
+        size = grids[-1][1][0]
+        grids = [(file, grid) for file, grid in grids if grid[0] == size]
+        width, height = size
+        shape = (len(grids), height, width)
+        header = npy_header(shape)
+
+        npy_filename = f"{self.basename}.npy"
+        json_filename = f"{self.basename}.json"
+        npy_path = os.path.join(directory, npy_filename)
+        json_path = os.path.join(directory, json_filename)
+
+        # Write to temporary files and rename so readers never map a partial file
+        with open(npy_path + '.tmp', 'wb') as grid_file:
+            grid_file.write(header)
+            for _, (_, levels) in grids:
+                grid_file.write(levels)
+        os.replace(npy_path + '.tmp', npy_path)
+
+        description = dict(metadata)
+        description.update({
+            'file': npy_filename,
+            'dtype': 'uint8',
+            'shape': list(shape),
+            'data_offset': len(header),
+            'timestamps': [file.split('.')[2] for file, _ in grids],
+            'rain_rates_mm_per_hour': RAIN_RATES,
+        })
+        with open(json_path + '.tmp', 'w') as json_file:
+            json.dump(description, json_file, indent=2)
+        os.replace(json_path + '.tmp', json_path)
+
+        logging.info(f"Wrote precipitation grid {npy_filename} with shape {shape}")
+        return [npy_filename, json_filename]
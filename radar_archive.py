@@ -0,0 +1,155 @@
+"""
+Local time-indexed archive of raw BOM radar frames
+
+Every raw radar frame downloaded from BOM is appended to a local archive so
+that it never has to be fetched twice and so loops longer than BOM's own short
+window (or replays of past events) can be rendered without any FTP traffic.
+
+Layout of the archive directory:
+    index.sqlite            frame index: (product_id, timestamp) -> blob hash
+    blobs/ab/abcdef....png  raw frame bytes, content-addressed by SHA-256
+
+Frames are never modified once archived. Old frames are removed by prune()
+according to the configured retention age and per-product frame limit, and
+blobs that are no longer referenced are deleted with them.
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+from frame_discovery import TIMESTAMP_FORMAT
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS frames (
+    product_id TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    archived_at REAL NOT NULL,
+    PRIMARY KEY (product_id, timestamp)
+)
+"""
+
+
+class RadarArchive:
+    """Append-only store of raw radar frames indexed by product and timestamp"""
+
+    def __init__(self, directory, retention_hours=24, max_frames=1000):
+        self.directory = directory
+        self.blob_directory = os.path.join(directory, 'blobs')
+        self.retention_hours = retention_hours
+        self.max_frames = max_frames
+
+        os.makedirs(self.blob_directory, exist_ok=True)
+        # Used from the pipeline's download thread as well as the main thread,
+        # but never from both at once
+        self.db = sqlite3.connect(os.path.join(directory, 'index.sqlite'), check_same_thread=False)
+        self.db.execute(SCHEMA)
+        self.db.commit()
+
+    @classmethod
+    def from_config(cls, config):
+        """Build an archive from the loaded configuration, or None if disabled"""
+        if not config['archive_enabled']:
+            return None
+        archive = cls(
+            config['archive_directory'],
+            retention_hours=config['archive_retention_hours'],
+            max_frames=config['archive_max_frames'],
+        )
+        logging.info(f"Radar archive enabled at {config['archive_directory']} "
+                     f"({archive.count()} frames archived)")
+        return archive
+
+    def _blob_path(self, digest):
+        return os.path.join(self.blob_directory, digest[:2], digest + '.png')
+
+    def count(self, product_id=None):
+        """Number of archived frames, optionally for a single product"""
+        if product_id is None:
+            return self.db.execute("SELECT COUNT(*) FROM frames").fetchone()[0]
+        return self.db.execute("SELECT COUNT(*) FROM frames WHERE product_id = ?",
+                               (product_id,)).fetchone()[0]
+
+    def get(self, product_id, timestamp):
+        """Raw bytes of an archived frame, or None if it is not archived
+
+        Args:
+            product_id: BOM product ID, e.g. IDR022
+            timestamp: UTC timestamp string in YYYYMMDDHHmm format
+        """
+        row = self.db.execute("SELECT sha256 FROM frames WHERE product_id = ? AND timestamp = ?",
+                              (product_id, timestamp)).fetchone()
+        if row is None:
+            return None
+        try:
+            with open(self._blob_path(row[0]), 'rb') as blob:
+                return blob.read()
+        except OSError as e:
+            logging.warning(f"Archived frame {product_id} {timestamp} is unreadable: {e}")
+            return None
+
+    def put(self, product_id, timestamp, data):
+        """Archive a raw frame; frames that are already archived are left untouched"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = path + '.tmp'
+            with open(temp_path, 'wb') as blob:
+                blob.write(data)
+            os.replace(temp_path, path)
+
+        self.db.execute("INSERT OR IGNORE INTO frames VALUES (?, ?, ?, ?, ?)",
+                        (product_id, timestamp, digest, len(data), time.time()))
+        self.db.commit()
+        logging.debug(f"Archived {product_id} {timestamp} ({len(data)} bytes)")
+
+    def timestamps(self, product_id, start=None, end=None):
+        """Archived timestamps for a product, oldest first
+
+        Args:
+            product_id: BOM product ID
+            start: Optional earliest timestamp string (inclusive)
+            end: Optional latest timestamp string (inclusive)
+        """
+        query = "SELECT timestamp FROM frames WHERE product_id = ?"
+        params = [product_id]
+        if start is not None:
+            query += " AND timestamp >= ?"
+            params.append(start)
+        if end is not None:
+            query += " AND timestamp <= ?"
+            params.append(end)
+        query += " ORDER BY timestamp"
+        return [row[0] for row in self.db.execute(query, params)]
+
+    def prune(self):
+        """Apply the retention limits and delete blobs that are no longer referenced"""
+        removed = 0
+        if self.retention_hours > 0:
+            cutoff = (datetime.utcnow() - timedelta(hours=self.retention_hours)).strftime(TIMESTAMP_FORMAT)
+            removed += self.db.execute("DELETE FROM frames WHERE timestamp < ?", (cutoff,)).rowcount
+
+        if self.max_frames > 0:
+            products = [row[0] for row in self.db.execute("SELECT DISTINCT product_id FROM frames")]
+            for product_id in products:
+                removed += self.db.execute(
+                    "DELETE FROM frames WHERE product_id = ? AND timestamp NOT IN "
+                    "(SELECT timestamp FROM frames WHERE product_id = ? ORDER BY timestamp DESC LIMIT ?)",
+                    (product_id, product_id, self.max_frames)).rowcount
+        self.db.commit()
+
+        if not removed:
+            return
+
+        referenced = {row[0] for row in self.db.execute("SELECT DISTINCT sha256 FROM frames")}
+        for root, _, filenames in os.walk(self.blob_directory):
+            for filename in filenames:
+                if filename.endswith('.png') and filename[:-4] not in referenced:
+                    os.remove(os.path.join(root, filename))
+
+        logging.info(f"Pruned {removed} frames from radar archive")
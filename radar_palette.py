@@ -0,0 +1,39 @@
+"""
+Bureau of Meteorology (BOM) Radar Rain Rate Palette
+
+BOM radar images draw rainfall using a fixed 15 colour palette, from very
+light (off-white) through blues, greens, yellows and reds to black-red for
+the heaviest falls. Each entry maps a palette colour to its intensity level
+(1 = lightest, 15 = heaviest) and the approximate rain rate in mm/h shown on
+the BOM legend. Level 0 means no rain (transparent or any other colour).
+
+Data format: (R, G, B): (level, rain_rate_mm_per_hour)
+"""
+
+BOM_RAIN_PALETTE = {
+    (245, 245, 255): (1, 0.2),
+    (180, 180, 255): (2, 0.5),
+    (120, 120, 255): (3, 1.5),
+    (20, 20, 255): (4, 2.5),
+    (0, 216, 195): (5, 4),
+    (0, 150, 144): (6, 6),
+    (0, 102, 102): (7, 10),
+    (255, 255, 0): (8, 15),
+    (255, 200, 0): (9, 20),
+    (255, 150, 0): (10, 35),
+    (255, 100, 0): (11, 50),
+    (255, 0, 0): (12, 80),
+    (200, 0, 0): (13, 120),
+    (120, 0, 0): (14, 200),
+    (40, 0, 0): (15, 360),
+}
+
+# Rain rate in mm/h for each intensity level (index = level)
+RAIN_RATES = [0] + [rate for _, rate in sorted(BOM_RAIN_PALETTE.values())]
+
+
+def rain_level(pixel):
+    """Intensity level (0-15) of an RGBA or RGB pixel"""
+    if len(pixel) == 4 and pixel[3] == 0:
+        return 0
+    return BOM_RAIN_PALETTE.get(tuple(pixel[:3]), (0, 0))[0]
@@ -0,0 +1,123 @@
+"""
+Additional renditions of the radar composites
+
+A rendition is a variant of the composited loop for a particular display, for
+example a zoom centred on the residential location for a phone dashboard or
+a small thumbnail for a wall tablet. Renditions are cut from the in-memory
+composites, so producing them never requires compositing again.
+
+Each rendition is configured as:
+    name:   Output file name without extension
+    crop:   Optional square window size in pixels, centred on the residential
+            location (or the radar centre if no location is configured)
+    size:   Optional [width, height] to resize to
+    format: png (one file per frame), gif (animated loop), webp or jpeg
+"""
+import logging
+
+from PIL import Image
+
+# Radar portion of every BOM radar image (the legend sits below it)
+RADAR_SIZE = 512
+
+FORMATS = {
+    'png': 'PNG',
+    'gif': 'GIF',
+    'webp': 'WEBP',
+    'jpeg': 'JPEG',
+}
+
+
+class Rendition:
+    """A crop/resize/format variant of the radar loop"""
+
+    def __init__(self, name, crop=None, size=None, format='png'):
+        self.name = name
+        self.crop = crop
+        self.size = size
+        self.format = format
+
+    @classmethod
+    def from_dict(cls, spec):
+        """Build a rendition from its configuration entry, or None if it is invalid"""
+        name = spec.get('name')
+        if not name:
+            logging.warning(f"Ignoring rendition without a name: {spec}")
+            return None
+
+        format = str(spec.get('format', 'png')).lower()
+        if format == 'jpg':
+            format = 'jpeg'
+        if format not in FORMATS:
+            logging.warning(f"Ignoring rendition {name}: unsupported format '{format}'")
+            return None
+
+        crop = spec.get('crop')
+        if crop is not None:
+            try:
+                crop = int(crop)
+            except (TypeError, ValueError):
+                crop = 0
+            if not 0 < crop <= RADAR_SIZE:
+                logging.warning(f"Ignoring rendition {name}: crop must be between 1 and {RADAR_SIZE} pixels")
+                return None
+
+        size = spec.get('size')
+        if size is not None:
+            try:
+                width, height = (int(value) for value in size)
+            except (TypeError, ValueError):
+                logging.warning(f"Ignoring rendition {name}: size must be [width, height]")
+                return None
+            if width <= 0 or height <= 0:
+                logging.warning(f"Ignoring rendition {name}: size must be positive, got [{width}, {height}]")
+                return None
+            size = (width, height)
+
+        return cls(name, crop=crop, size=size, format=format)
+
+    @property
+    def animated(self):
+        return self.format == 'gif'
+
+    def crop_box(self, center):
+        """Crop window of the configured size around center, kept inside the radar area
+
+        Args:
+            center: (x, y) pixel to centre the window on
+
+        Returns:
+            tuple: (left, top, right, bottom) box, or None for no cropping
+        """
+        if self.crop is None:
+            return None
+
+        half = self.crop // 2
+        left = min(max(center[0] - half, 0), RADAR_SIZE - self.crop)
+        top = min(max(center[1] - half, 0), RADAR_SIZE - self.crop)
+        return (left, top, left + self.crop, top + self.crop)
+
+    def apply(self, frame, box):
+        """Crop and resize a composited frame for this rendition"""
+        image = frame.crop(box) if box is not None else frame
+        if self.size is not None and image.size != self.size:
+            image = image.resize(self.size, Image.LANCZOS)
+        if self.format == 'jpeg':
+            image = image.convert('RGB')
+        return image
+
+    def filenames(self, count):
+        """Output filenames for a loop of count frames"""
+        if self.animated:
+            return [f"{self.name}.gif"]
+        return [f"{self.name}_{i+1}.{self.format}" for i in range(count)]
+
+
+def load_renditions(specs):
+    """Parse the renditions configuration list, skipping invalid entries"""
+    renditions = []
+    for spec in specs or []:
+        rendition = Rendition.from_dict(spec)
+        if rendition is not None:
+            renditions.append(rendition)
+    return renditions
@@ -0,0 +1,118 @@
+"""
+Reprojection of overlay radars into the primary radar's pixel grid
+
+Every BOM radar image is a local equirectangular projection centred on its
+own radar: 512x512 pixels, `km_per_pixel` from RADAR_METADATA, with east-west
+distances scaled by the cosine of the radar's latitude. Pasting an overlay at
+a pixel offset is only correct when both radars share the same scale, so a
+128km overlay on a 256km primary would be drawn at twice its true size.
+
+Mapping a primary pixel to latitude/longitude and then to an overlay pixel is
+affine in both axes:
+
+    overlay_x = a * primary_x + c
+    overlay_y = e * primary_y + f
+
+with a = (k_primary / k_overlay) * cos(lat_overlay) / cos(lat_primary) and
+e = k_primary / k_overlay. The coefficients are computed once per radar pair
+and applied to each frame as a single nearest-neighbour affine resample in
+Pillow's C code, the vectorised equivalent of a precomputed gather index map.
+Nearest-neighbour keeps BOM palette colours exact.
+"""
+import logging
+import math
+
+from PIL import Image
+
+# Earth's radius in km
+R = 6371.0
+
+# BOM radar images are always 512x512 with the radar at the centre
+RADAR_SIZE = 512
+CENTER = RADAR_SIZE // 2
+
+
+def affine_coefficients(primary, overlay):
+    """Affine transform taking primary pixel coordinates to overlay pixel coordinates
+
+    Args:
+        primary: (latitude, longitude, km_per_pixel) of the primary radar
+        overlay: (latitude, longitude, km_per_pixel) of the overlay radar
+
+    Returns:
+        tuple: (a, b, c, d, e, f) as used by Image.transform with Image.AFFINE
+    """
+    primary_lat, primary_lon, primary_km_per_pixel = primary
+    overlay_lat, overlay_lon, overlay_km_per_pixel = overlay
+
+    cos_primary = math.cos(math.radians(primary_lat))
+    cos_overlay = math.cos(math.radians(overlay_lat))
+    scale = primary_km_per_pixel / overlay_km_per_pixel
+
+    # x: primary pixel -> longitude -> overlay pixel (east is positive)
+    a = scale * cos_overlay / cos_primary
+    c = CENTER - CENTER * a + math.radians(primary_lon - overlay_lon) * R * cos_overlay / overlay_km_per_pixel
+
+    # y: primary pixel -> latitude -> overlay pixel (y increases southward)
+    e = scale
+    f = CENTER - CENTER * e - math.radians(primary_lat - overlay_lat) * R / overlay_km_per_pixel
+
+    return (a, 0.0, c, 0.0, e, f)
+
+
+def footprint(coefficients):
+    """Bounding box of the overlay radar area in primary pixel coordinates"""
+    a, _, c, _, e, f = coefficients
+    return ((0 - c) / a, (0 - f) / e, (RADAR_SIZE - c) / a, (RADAR_SIZE - f) / e)
+
+
+class Reprojector:
+    """Caches per radar pair transforms and resamples overlay frames with them"""
+
+    def __init__(self):
+        self.transforms = {}  # (primary_id, overlay_id) -> coefficients, or None if no overlap
+
+    def prepare(self, primary_id, primary_metadata, overlay_id, overlay_metadata):
+        """Compute (once) the transform for a radar pair
+
+        Returns:
+            bool: True if the overlay radar overlaps the primary radar
+        """
+        key = (primary_id, overlay_id)
+        if key not in self.transforms:
+            coefficients = affine_coefficients(primary_metadata, overlay_metadata)
+            left, top, right, bottom = footprint(coefficients)
+            overlaps = left < RADAR_SIZE and right > 0 and top < RADAR_SIZE and bottom > 0
+
+            if overlaps:
+                logging.info(f"Reprojecting {overlay_id} onto {primary_id}: scale "
+                             f"{1 / coefficients[0]:.3f}x{1 / coefficients[4]:.3f}, footprint "
+                             f"({left:.0f}, {top:.0f}) to ({right:.0f}, {bottom:.0f})")
+                # Pillow samples at pixel centres (x + 0.5, y + 0.5)
+                a, b, c, d, e, f = coefficients
+                self.transforms[key] = (a, b, c + 0.5 * (1 - a), d, e, f + 0.5 * (1 - e))
+            else:
+                logging.warning(f"Radar {overlay_id} does not overlap with primary radar {primary_id} - skipping")
+                self.transforms[key] = None
+
+        return self.transforms[key] is not None
+
+    def retain(self, pairs):
+        """Forget the transforms of radar pairs other than pairs"""
+        self.transforms = {key: transform for key, transform in self.transforms.items() if key in pairs}
+
+    def apply(self, image, primary_id, overlay_id, size):
+        """Resample an overlay frame into the primary radar's pixel grid
+
+        Args:
+            image: Overlay radar image in RGBA mode
+            primary_id: Primary radar product ID
+            overlay_id: Overlay radar product ID
+            size: Size of the primary canvas
+
+        Returns:
+            PIL Image of the given size, aligned with the primary radar
+        """
+        coefficients = self.transforms[(primary_id, overlay_id)]
+        return image.transform(size, Image.AFFINE, coefficients,
+                               resample=Image.NEAREST, fillcolor=(0, 0, 0, 0))
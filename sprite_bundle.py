@@ -0,0 +1,119 @@
+"""
+Single-file bundle of the radar loop
+
+Every file copied to the SMB share costs a create, write and close, each with
+its own network round trips. The bundle packs the whole loop into one PNG
+sprite sheet, the frames stacked vertically, with a JSON manifest stored in a
+tEXt chunk of the same file:
+
+    {
+      "version": 1,
+      "product_id": "IDR022",
+      "frame_width": 512, "frame_height": 557, "frame_count": 5,
+      "timezone": "Australia/Melbourne",
+      "frames": [
+        {"time": "2026-10-19T00:25:00Z", "local": "2026-10-19T11:25:00+11:00",
+         "y": 0, "duration_ms": 500},
+        ...
+      ]
+    }
+
+A dashboard card shows frame i by offsetting the sheet by `y` pixels. The
+manifest can also be written next to the sheet as a plain JSON file for
+clients that cannot read PNG chunks.
+"""
+import json
+import logging
+import os
+from datetime import datetime
+
+import pytz
+from PIL.PngImagePlugin import PngInfo
+
+MANIFEST_KEY = 'radar-bundle'
+
+
+class SpriteBundle:
+    """Writes the loop as one sprite sheet PNG with an embedded manifest"""
+
+    def __init__(self, basename='radar_bundle', manifest_file=False):
+        """
+        Args:
+            basename: Output filename without extension
+            manifest_file: Also write the manifest as <basename>.json
+        """
+        self.basename = basename
+        self.manifest_file = manifest_file
+
+    @classmethod
+    def from_config(cls, config):
+        """Build a bundle writer from the loaded configuration, or None if disabled"""
+        if not config['bundle_enabled']:
+            return None
+        return cls(config['bundle_basename'], manifest_file=config['bundle_manifest_file'])
+
+    @property
+    def filename(self):
+        return f"{self.basename}.png"
+
+    def sheet(self, frames, canvas_pool):
+        """Frames stacked vertically in one pooled canvas"""
+        width, height = frames[0].size
+        sheet = canvas_pool.acquire(frames[0].mode, (width, height * len(frames)))
+        for i, frame in enumerate(frames):
+            sheet.paste(frame, (0, i * height))
+        return sheet
+
+    def manifest(self, frame_size, timestamps, durations, product_id, timezone):
+        """Manifest describing the sheet
+
+        Args:
+            frame_size: (width, height) of one frame
+            timestamps: Frame times as YYYYMMDDHHmm strings in UTC, oldest first
+            durations: Display time of each frame in milliseconds
+            product_id: Primary radar product
+            timezone: Timezone name for the local frame times
+        """
+        width, height = frame_size
+        local_tz = pytz.timezone(timezone)
+        frames = []
+        for i, (timestamp, duration) in enumerate(zip(timestamps, durations)):
+            try:
+                time_utc = pytz.utc.localize(datetime.strptime(timestamp, '%Y%m%d%H%M'))
+                time, local = time_utc.strftime('%Y-%m-%dT%H:%M:%SZ'), time_utc.astimezone(local_tz).isoformat()
+            except ValueError:
+                time = local = None
+            frames.append({'time': time, 'local': local, 'y': i * height, 'duration_ms': duration})
+        return {
+            'version': 1,
+            'product_id': product_id,
+            'frame_width': width,
+            'frame_height': height,
+            'frame_count': len(frames),
+            'timezone': timezone,
+            'frames': frames,
+        }
+
+    def save(self, encoder, directory, sheet, manifest):
+        """Queue the sheet with its manifest on the encoder and write the JSON manifest file
+
+        The sheet is reported by the next encoder.wait().
+
+        Returns:
+            list: Files written directly (the JSON manifest, if enabled)
+        """
+        text = json.dumps(manifest, separators=(',', ':'))
+        pnginfo = PngInfo()
+        pnginfo.add_text(MANIFEST_KEY, text)
+        encoder.save(self.filename, sheet, os.path.join(directory, self.filename),
+                     pnginfo=pnginfo, **encoder.png_params())
+        logging.info(f"Encoding loop bundle: {self.filename} ({manifest['frame_count']} frames)")
+
+        if not self.manifest_file:
+            return []
+        filename = f"{self.basename}.json"
+        path = os.path.join(directory, filename)
+        with open(path + '.tmp', 'w') as manifest_file:
+            json.dump(manifest, manifest_file, indent=1)
+        os.replace(path + '.tmp', path)
+        return [filename]
@@ -0,0 +1,65 @@
+"""
+Warm-restart state snapshot
+
+At the end of every successful cycle the processor's working state (base
+image, recent raw frames and composites, frame discovery history, the last
+frame set and the upload manifest) is written to a single snapshot file.
+On startup the snapshot is loaded again, so the first cycle after a container
+restart or image update behaves like any other warm cycle instead of
+re-downloading and rebuilding everything.
+
+Images are stored as zlib-compressed raw pixel data rather than PNG, which
+is much faster to write and read. The snapshot is written to a temporary file
+and renamed into place, so a crash mid-write never leaves a corrupt snapshot.
+"""
+import logging
+import os
+import pickle
+import zlib
+
+from PIL import Image
+
+SNAPSHOT_VERSION = 1
+
+
+def pack_image(image):
+    """Compact, picklable representation of a PIL image"""
+    return (image.mode, image.size, zlib.compress(image.tobytes(), 1))
+
+
+def unpack_image(packed):
+    """Rebuild a PIL image from pack_image() output"""
+    mode, size, data = packed
+    return Image.frombytes(mode, size, zlib.decompress(data))
+
+
+def save_snapshot(path, state):
+    """Atomically write the state dictionary to path"""
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as snapshot:
+        pickle.dump({'version': SNAPSHOT_VERSION, 'state': state}, snapshot, protocol=pickle.HIGHEST_PROTOCOL)
+        snapshot.flush()
+        os.fsync(snapshot.fileno())
+    os.replace(temp_path, path)
+    logging.debug(f"Saved state snapshot to {path} ({os.path.getsize(path)} bytes)")
+
+
+def load_snapshot(path):
+    """Load a state dictionary written by save_snapshot()
+
+    Returns:
+        dict, or None if there is no usable snapshot
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as snapshot:
+            data = pickle.load(snapshot)
+    except Exception as e:
+        logging.warning(f"Ignoring unreadable state snapshot {path}: {e}")
+        return None
+
+    if not isinstance(data, dict) or data.get('version') != SNAPSHOT_VERSION:
+        logging.warning(f"Ignoring state snapshot {path} from an incompatible version")
+        return None
+    return data['state']